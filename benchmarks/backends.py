@@ -0,0 +1,100 @@
+"""In-memory stand-in backends for benchmarking flask-forward.
+
+``make_backends`` returns user, token and client service classes, ready to
+hand to ``FlaskForward``, that share one in-memory store and sleep for a
+configurable latency on every call to simulate a remote store.
+"""
+import time
+
+
+class MemoryDb(object):
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.clients = {}
+        self.tokens = {}
+
+    def wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def add_client(self, client_id, scopes, redirect_uri):
+        self.clients[client_id] = {
+            'scopes': list(scopes),
+            'redirect_uris': [redirect_uri],
+            'response_types': ['token'],
+        }
+
+    def add_token(self, token, client_id, scopes):
+        self.tokens[token] = (client_id, frozenset(scopes))
+
+
+def make_backends(db):
+
+    class UserService(object):
+        pass
+
+    class TokenService(object):
+
+        def save(self, token, request, *args, **kwargs):
+            db.wait()
+            db.add_token(
+                token['access_token'],
+                request.client_id,
+                (token.get('scope') or '').split()
+            )
+
+        def save_many(self, items):
+            db.wait()
+            for token, request in items:
+                db.add_token(
+                    token['access_token'],
+                    request.client_id,
+                    (token.get('scope') or '').split()
+                )
+
+        def revoke(self, token, token_type_hint, request, *args, **kwargs):
+            db.wait()
+            db.tokens.pop(token, None)
+
+        def revoke_many(self, items):
+            db.wait()
+            for token, token_type_hint, request in items:
+                db.tokens.pop(token, None)
+
+        def validate(self, token, scopes, request):
+            db.wait()
+            entry = db.tokens.get(token)
+            return entry is not None and entry[1].issuperset(scopes or ())
+
+    class ClientService(object):
+
+        def get_client(self, client_id, request):
+            db.wait()
+            return db.clients.get(client_id)
+
+        def get_redirect_uri(self, client_id, request, *args, **kwargs):
+            db.wait()
+            return db.clients[client_id]['redirect_uris'][0]
+
+        def get_scopes(self, client_id, request, *args, **kwargs):
+            db.wait()
+            return db.clients[client_id]['scopes']
+
+        def validate_client_id(self, client_id, request, *args, **kwargs):
+            db.wait()
+            return client_id in db.clients
+
+        def validate_redirect_uri(self, client_id, redirect_uri, request, *args, **kwargs):
+            db.wait()
+            return redirect_uri in db.clients[client_id]['redirect_uris']
+
+        def validate_response_type(self, client_id, response_type, client, request, *args, **kwargs):
+            db.wait()
+            return response_type in db.clients[client_id]['response_types']
+
+        def validate_scopes(self, client_id, scopes, client, request, *args, **kwargs):
+            db.wait()
+            return set(scopes).issubset(db.clients[client_id]['scopes'])
+
+    return UserService, TokenService, ClientService
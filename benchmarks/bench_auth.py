@@ -0,0 +1,304 @@
+"""Measure the per-request cost of flask-forward.
+
+Drives a Flask app through its test client (no network) against the
+in-memory backends in ``backends.py`` and reports latency percentiles and
+throughput for each scenario. Results can be written as JSON and compared
+with an earlier run::
+
+    python benchmarks/bench_auth.py --output before.json
+    git checkout my-branch
+    python benchmarks/bench_auth.py --compare before.json
+
+Any ``FORWARD_*`` setting can be passed with ``--config KEY=VALUE`` (values
+are parsed as JSON when possible), e.g. ``--config FORWARD_TOKEN_CACHE_TTL=60``.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask, request
+from werkzeug.test import EnvironBuilder
+
+from flask_forward import FlaskForward, OAuthRequest
+
+from backends import MemoryDb, make_backends
+
+CLIENT_ID = 'bench-client'
+REDIRECT_URI = 'https://client.example.com/callback'
+SCOPES = ['read', 'write']
+
+
+def create_app(latency=0.0, config=None):
+    db = MemoryDb(latency)
+    db.add_client(CLIENT_ID, SCOPES, REDIRECT_URI)
+    db.add_token('bench-token', CLIENT_ID, SCOPES)
+
+    app = Flask(__name__)
+    app.config.update(config or {})
+    user_cls, token_cls, client_cls = make_backends(db)
+    forward = FlaskForward(app, user_cls, token_cls, client_cls)
+    api = forward.auth_api
+
+    @app.route('/open')
+    def open_view():
+        return 'ok'
+
+    @app.route('/client')
+    @api.auth_required(client_auth=True)
+    def client_view():
+        return str(request.authorized)
+
+    @app.route('/token')
+    @api.auth_required(token_auth=True, scope=SCOPES)
+    def token_view():
+        return str(request.authorized)
+
+    @app.route('/both')
+    @api.auth_required(client_auth=True, token_auth=True, scope=SCOPES)
+    def both_view():
+        return str(request.authorized)
+
+    @app.route('/authorize', methods=['POST'])
+    def authorize_view():
+        request.user = 'bench-user'
+        headers, body, status = api.build_authorization_response(request)
+        return body or '', status, headers
+
+    @app.route('/revoke', methods=['POST'])
+    def revoke_view():
+        headers, body, status = api.build_revocation_response(request)
+        return body or '', status, headers
+
+    return app, forward, db
+
+
+def form_environ(data):
+    builder = EnvironBuilder(path='/authorize', method='POST', data=data,
+                             headers={'client-id': CLIENT_ID})
+    environ = builder.get_environ()
+    body = environ['wsgi.input'].read()
+    return environ, body
+
+
+def scenarios(app, forward, db):
+    client = app.test_client()
+    auth_headers = {
+        'client-id': CLIENT_ID,
+        'Authorization': 'Bearer bench-token',
+    }
+    authorize_form = {
+        'client-id': CLIENT_ID,
+        'response-type': 'token',
+        'redirect-uri': REDIRECT_URI,
+        'scope': ' '.join(SCOPES),
+    }
+    environ, body = form_environ(authorize_form)
+    revoked = iter(range(sys.maxsize))
+
+    def request_construction():
+        OAuthRequest(dict(environ))
+
+    def to_auth_req():
+        env = dict(environ)
+        env['wsgi.input'] = io.BytesIO(body)
+        OAuthRequest(env).to_auth_req()
+
+    def unprotected():
+        return client.get('/open')
+
+    def client_auth():
+        return client.get('/client', headers=auth_headers)
+
+    def token_auth():
+        return client.get('/token', headers=auth_headers)
+
+    def client_and_token_auth():
+        return client.get('/both', headers=auth_headers)
+
+    def issue_token():
+        return client.post('/authorize', data=authorize_form)
+
+    def revoke():
+        token = 'revoke-%d' % next(revoked)
+        db.add_token(token, CLIENT_ID, SCOPES)
+        return client.post('/revoke', data={'client-id': CLIENT_ID, 'token': token})
+
+    return [
+        ('request_construction', request_construction),
+        ('to_auth_req', to_auth_req),
+        ('unprotected', unprotected),
+        ('client_auth', client_auth),
+        ('token_auth', token_auth),
+        ('client_and_token_auth', client_and_token_auth),
+        ('issue_token', issue_token),
+        ('revoke', revoke),
+    ]
+
+
+# Status and body each scenario's response must have, checked once before
+# timing so a misconfigured run fails instead of measuring error paths.
+EXPECTED = {
+    'unprotected': (200, b'ok'),
+    'client_auth': (200, b'True'),
+    'token_auth': (200, b'True'),
+    'client_and_token_auth': (200, b'True'),
+    'issue_token': (302, None),
+    'revoke': (200, None),
+}
+
+
+def check(name, fn):
+    """Run scenario ``fn`` once and raise AssertionError if its response
+    is not the expected one."""
+    response = fn()
+    if name not in EXPECTED:
+        return
+    status, body = EXPECTED[name]
+    ok = response.status_code == status and \
+        (body is None or response.get_data() == body)
+    if ok and status == 302:
+        ok = 'access_token=' in response.headers.get('Location', '')
+    if not ok:
+        raise AssertionError('%s: unexpected response %d %r' % (
+            name, response.status_code, response.get_data()[:200]))
+
+
+def percentile(ordered, pct):
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(fn, iterations, warmup):
+    for _ in range(warmup):
+        fn()
+
+    timings = []
+    clock = time.perf_counter_ns
+    started = clock()
+    for _ in range(iterations):
+        t = clock()
+        fn()
+        timings.append(clock() - t)
+    elapsed = clock() - started
+
+    timings.sort()
+    us = 1000.0
+    return {
+        'iterations': iterations,
+        'mean_us': sum(timings) / len(timings) / us,
+        'p50_us': percentile(timings, 50) / us,
+        'p90_us': percentile(timings, 90) / us,
+        'p99_us': percentile(timings, 99) / us,
+        'max_us': timings[-1] / us,
+        'rps': iterations / (elapsed / 1e9),
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    import flask
+    import oauthlib
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'flask': getattr(flask, '__version__', None),
+        'oauthlib': getattr(oauthlib, '__version__', None),
+        'platform': platform.platform(),
+    }
+
+
+def parse_config(pairs):
+    config = {}
+    for pair in pairs:
+        key, _, value = pair.partition('=')
+        try:
+            config[key] = json.loads(value)
+        except ValueError:
+            config[key] = value
+    return config
+
+
+def report(results, baseline=None, out=sys.stderr):
+    header = '%-24s %10s %10s %10s %10s %12s' % (
+        'scenario', 'mean us', 'p50 us', 'p99 us', 'max us', 'req/s')
+    if baseline:
+        header += '  %8s' % 'p50 diff'
+    print(header, file=out)
+
+    for name, r in results.items():
+        line = '%-24s %10.1f %10.1f %10.1f %10.1f %12.0f' % (
+            name, r['mean_us'], r['p50_us'], r['p99_us'], r['max_us'], r['rps'])
+        before = (baseline or {}).get(name)
+        if before:
+            line += '  %+7.1f%%' % (
+                (r['p50_us'] - before['p50_us']) / before['p50_us'] * 100)
+        print(line, file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--iterations', type=int, default=2000)
+    parser.add_argument('--warmup', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=0.0,
+                        help='simulated backend latency per call')
+    parser.add_argument('-s', '--scenario', action='append',
+                        help='only run the named scenario (repeatable)')
+    parser.add_argument('--config', action='append', default=[],
+                        metavar='KEY=VALUE', help='app.config override')
+    parser.add_argument('-o', '--output', help='write JSON results here')
+    parser.add_argument('--compare', help='JSON results of an earlier run')
+    args = parser.parse_args(argv)
+
+    config = parse_config(args.config)
+    app, forward, db = create_app(args.latency_ms / 1000.0, config)
+
+    results = {}
+    for name, fn in scenarios(app, forward, db):
+        if args.scenario and name not in args.scenario:
+            continue
+        with app.app_context():
+            check(name, fn)
+            results[name] = measure(fn, args.iterations, args.warmup)
+    forward.close()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    report(results, baseline)
+
+    output = {
+        'environment': environment(),
+        'parameters': {
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+            'latency_ms': args.latency_ms,
+            'config': config,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2, sort_keys=True)
+    else:
+        json.dump(output, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Compare the bundled token stores under concurrent load.
+
+Each worker thread saves, validates and revokes tokens against a shared
+store. Validations dominate the mix (``--reads`` per save), as they do in
+a running service. Reports operations per second and validation latency
+percentiles for every store and thread count::
+
+    python benchmarks/bench_stores.py --threads 1 4 16
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask_forward.stores import MemoryTokenService, SQLiteTokenService
+
+from bench_auth import environment, percentile
+
+SCOPES = ['read', 'write']
+
+
+class Request(object):
+
+    def __init__(self, client_id='bench-client', user='bench-user', scopes=SCOPES):
+        self.client_id = client_id
+        self.user = user
+        self.scopes = scopes
+
+
+def make_stores(directory):
+    return [
+        ('memory', MemoryTokenService),
+        ('sqlite', lambda: SQLiteTokenService(
+            os.path.join(directory, 'bench-%d.db' % time.perf_counter_ns()))),
+    ]
+
+
+def worker(service, index, operations, reads, batch, latencies):
+    request = Request()
+    clock = time.perf_counter_ns
+    for i in range(operations):
+        tokens = ['w%d-%d-%d' % (index, i, j) for j in range(batch)]
+        service.save_many([
+            ({'access_token': token, 'scope': 'read write', 'expires_in': 3600},
+             request)
+            for token in tokens
+        ])
+        for j in range(reads):
+            t = clock()
+            service.validate(tokens[j % batch], SCOPES, Request())
+            latencies.append(clock() - t)
+        service.revoke_many([(token, 'access_token', request) for token in tokens])
+
+
+def run(factory, threads, operations, reads, batch):
+    service = factory()
+    # Preload so lookups do not run against an empty table.
+    request = Request()
+    service.save_many([
+        ({'access_token': 'seed-%d' % i, 'scope': 'read', 'expires_in': 3600},
+         request)
+        for i in range(10000)
+    ])
+
+    latencies = []
+    pool = [
+        threading.Thread(target=worker, args=(
+            service, i, operations, reads, batch, latencies))
+        for i in range(threads)
+    ]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    total = threads * operations * (2 * batch + reads)
+    return {
+        'threads': threads,
+        'ops_per_s': total / elapsed,
+        'validate_p50_us': percentile(latencies, 50) / 1000.0,
+        'validate_p99_us': percentile(latencies, 99) / 1000.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-t', '--threads', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('-n', '--operations', type=int, default=200,
+                        help='save/validate/revoke rounds per thread')
+    parser.add_argument('--reads', type=int, default=20,
+                        help='validations per round')
+    parser.add_argument('--batch', type=int, default=10,
+                        help='tokens saved and revoked per round')
+    parser.add_argument('-o', '--output', help='write JSON results here')
+    args = parser.parse_args(argv)
+
+    results = {}
+    print('%-8s %8s %12s %14s %14s' % (
+        'store', 'threads', 'ops/s', 'validate p50', 'validate p99'),
+        file=sys.stderr)
+    with tempfile.TemporaryDirectory() as directory:
+        for name, factory in make_stores(directory):
+            for threads in args.threads:
+                r = run(factory, threads, args.operations, args.reads, args.batch)
+                results['%s-%d' % (name, threads)] = r
+                print('%-8s %8d %12.0f %12.1fus %12.1fus' % (
+                    name, threads, r['ops_per_s'],
+                    r['validate_p50_us'], r['validate_p99_us']),
+                    file=sys.stderr)
+
+    output = {'environment': environment(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2, sort_keys=True)
+    else:
+        json.dump(output, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+
+if __name__ == '__main__':
+    main()
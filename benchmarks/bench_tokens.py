@@ -0,0 +1,113 @@
+"""Compare access token generators.
+
+Measures raw generation throughput of oauthlib's default generator and
+``BufferedTokenGenerator`` from one and several threads, then the
+``issue_token`` scenario of ``bench_auth.py`` with each of them configured
+through ``FORWARD_TOKEN_GENERATOR``::
+
+    python benchmarks/bench_tokens.py --threads 1 4
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from oauthlib.oauth2.rfc6749.tokens import random_token_generator
+
+from flask_forward.tokens import BufferedTokenGenerator
+
+from bench_auth import (check, create_app, environment, measure, percentile,
+                        scenarios)
+
+GENERATORS = [
+    ('oauthlib', lambda: random_token_generator),
+    ('buffered', BufferedTokenGenerator),
+]
+
+
+def generate(generator, threads, count):
+    latencies = []
+
+    def worker():
+        clock = time.perf_counter_ns
+        timings = []
+        for _ in range(count):
+            t = clock()
+            generator(None)
+            timings.append(clock() - t)
+        latencies.extend(timings)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'threads': threads,
+        'tokens_per_s': threads * count / elapsed,
+        'p50_us': percentile(latencies, 50) / 1000.0,
+        'p99_us': percentile(latencies, 99) / 1000.0,
+    }
+
+
+def issuance(name, iterations, warmup):
+    config = {'FORWARD_TOKEN_GENERATOR': None if name == 'oauthlib' else name}
+    app, forward, db = create_app(config=config)
+    fn = dict(scenarios(app, forward, db))['issue_token']
+    with app.app_context():
+        check('issue_token', fn)
+        result = measure(fn, iterations, warmup)
+    forward.close()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-t', '--threads', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('-n', '--count', type=int, default=50000,
+                        help='tokens generated per thread')
+    parser.add_argument('--iterations', type=int, default=2000,
+                        help='issue_token requests per generator')
+    parser.add_argument('--warmup', type=int, default=200)
+    parser.add_argument('-o', '--output', help='write JSON results here')
+    args = parser.parse_args(argv)
+
+    results = {}
+    print('%-10s %8s %14s %10s %10s' % (
+        'generator', 'threads', 'tokens/s', 'p50 us', 'p99 us'), file=sys.stderr)
+    for name, factory in GENERATORS:
+        generator = factory()
+        for threads in args.threads:
+            r = generate(generator, threads, args.count)
+            results['%s-%d' % (name, threads)] = r
+            print('%-10s %8d %14.0f %10.2f %10.2f' % (
+                name, threads, r['tokens_per_s'], r['p50_us'], r['p99_us']),
+                file=sys.stderr)
+
+    print('\n%-10s %12s %10s %10s' % (
+        'generator', 'issue req/s', 'p50 us', 'p99 us'), file=sys.stderr)
+    for name, _ in GENERATORS:
+        r = issuance(name, args.iterations, args.warmup)
+        results['%s-issue_token' % name] = r
+        print('%-10s %12.0f %10.1f %10.1f' % (
+            name, r['rps'], r['p50_us'], r['p99_us']), file=sys.stderr)
+
+    output = {'environment': environment(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2, sort_keys=True)
+    else:
+        json.dump(output, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Check that ``import flask_forward`` stays cheap.
+
+Imports the package after flask in fresh interpreters with ``-X importtime``
+and fails (exit status 1) when the cumulative time of the ``flask_forward``
+line, i.e. the package and every module it loads that flask did not,
+exceeds the budget, or when it pulls in modules that should only load on
+first use (oauthlib, asyncio, the optional stores and caches)::
+
+    python benchmarks/import_budget.py --budget-ms 20
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+BUDGET_MS = 20.0
+
+FORBIDDEN = (
+    'oauthlib',
+    'asyncio',
+    'sqlite3',
+    'mmap',
+    'flask_forward.sharedcache',
+    'flask_forward.stores',
+)
+
+
+def import_time(package='flask_forward'):
+    """Cumulative import time in ms of ``package`` after ``import flask``,
+    and the names of all modules loaded by then."""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         'import flask; import %s; import sys; print("\\n".join(sys.modules))'
+         % package],
+        env=dict(os.environ, PYTHONPATH=ROOT),
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+    # Lines read "import time: self [us] | cumulative | name", the name
+    # indented by nesting depth.
+    for line in proc.stderr.splitlines():
+        fields = line[len('import time:'):].split('|')
+        if line.startswith('import time:') and len(fields) == 3 and \
+                fields[2].strip() == package:
+            return int(fields[1]) / 1000.0, proc.stdout.split()
+    raise RuntimeError('%s not found in -X importtime output.' % package)
+
+
+def check(runs=5):
+    """The fastest of ``runs`` import times and the forbidden modules loaded."""
+    own_ms, modules = min(import_time() for _ in range(runs))
+    loaded = [
+        name for name in modules
+        if any(name == f or name.startswith(f + '.') for f in FORBIDDEN)
+    ]
+    return own_ms, sorted(loaded)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS,
+                        help='time flask_forward may add to importing flask')
+    parser.add_argument('-r', '--runs', type=int, default=5,
+                        help='fresh interpreters to take the fastest of')
+    args = parser.parse_args(argv)
+
+    own_ms, loaded = check(args.runs)
+
+    print('import flask_forward: %.1f ms over flask (budget %.1f ms)'
+          % (own_ms, args.budget_ms))
+    failed = False
+    if own_ms > args.budget_ms:
+        print('over budget', file=sys.stderr)
+        failed = True
+    if loaded:
+        print('imported eagerly: %s' % ', '.join(loaded), file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,21 @@
-from oauthlib.oauth2 import MobileApplicationServer
-from oauthlib.oauth2 import RequestValidator as ReqVal
-from oauthlib.common import Request as OAuthlibRequest
 from werkzeug.local import LocalProxy
-from flask import Request, Response
-from functools import wraps
+from werkzeug.utils import cached_property
+from flask import Request, Response, request as current_request
+from flask import abort, current_app, stream_with_context
+from functools import partial, wraps
+import importlib
+import inspect
+import json
+from types import SimpleNamespace
+
+from ._async import call_async as _call_async, resolve as _resolve
+from .admission import AdmissionControl
+from .cache import (ClientRegistry, NegativeCache, SingleFlight, TokenCache,
+                    capture_attrs)
+from .metrics import StageMetrics
+from .policy import AuthPolicy, AuthPolicyRegistry
+from .scopes import ALL, ScopeRegistry, ScopeRequirement, split_scopes
+from .tokens import BufferedTokenGenerator, SignedTokenCodec
 
 try:
     from flask import _app_ctx_stack as stack
@@ -18,7 +30,29 @@ __all__ = (
 )
 
 
-class ValidatorService(ReqVal):
+class _LazyImport(object):
+    """Class attribute that imports ``module.name`` on first access."""
+
+    def __init__(self, module, name):
+        self.module = module
+        self.name = name
+        self.value = None
+
+    def __get__(self, instance, owner):
+        if self.value is None:
+            self.value = getattr(importlib.import_module(self.module), self.name)
+        return self.value
+
+
+class ValidatorService(object):
+    """oauthlib ``RequestValidator`` backed by the user, client and token
+    services.
+
+    oauthlib is not imported until a hook this class does not implement is
+    looked up; those fall back to ``RequestValidator``'s defaults.
+    """
+
+    request_validator_cls = _LazyImport('oauthlib.oauth2', 'RequestValidator')
 
     _REQUIRED_METHODS = {
         'user': [
@@ -38,19 +72,103 @@ class ValidatorService(ReqVal):
         ]
     }
 
-    user = token = client = None
+    user = token = client = token_cache = token_codec = write_behind = None
+    scope_registry = client_registry = single_flight = None
+    rejected_tokens = rejected_clients = None
+    check_signed_revocations = False
+    metrics = StageMetrics()
 
     def __init__(self, *args, **kwargs):
+        self.metrics = kwargs.pop('metrics', None) or self.metrics
+        self.single_flight = kwargs.pop('single_flight', None)
+        scope_registry = kwargs.pop('scope_registry', None)
+        # Registries are falsy while empty, as they are before any route
+        # has been decorated.
+        self.scope_registry = scope_registry if scope_registry is not None \
+            else ScopeRegistry()
+        self.token_cache = kwargs.pop('token_cache', None)
+        self.token_codec = kwargs.pop('token_codec', None)
+        write_behind = kwargs.pop('write_behind', None)
+        client_cache = kwargs.pop('client_cache', None)
+        negative_cache = kwargs.pop('negative_cache', None)
+        check_revoked = kwargs.pop('check_signed_revocations', False)
 
         for k,v in kwargs.items():
-            if k in self.REQUIRED_METHODS:
-                for m in self.REQUIRED_METHODS[K]:
-                    if not callable(getattr(v, m)):
+            if k in self._REQUIRED_METHODS:
+                for m in self._REQUIRED_METHODS[k]:
+                    if not callable(getattr(v, m, None)):
                         raise NotImplementedError(
                                 "%s object must implement %s method." % (k,m)
                             )
-                    else:
-                        setattr(self, k, v)
+                setattr(self, k, v)
+
+        if write_behind:
+            from .writebehind import WriteBehindQueue
+            self.write_behind = WriteBehindQueue(
+                self.token,
+                scope_registry=self.scope_registry,
+                **write_behind
+            )
+
+        if client_cache and callable(getattr(self.client, 'get_client', None)):
+            self.client_registry = ClientRegistry(
+                self.client,
+                single_flight=self.single_flight,
+                **client_cache
+            )
+
+        if check_revoked and self.token_codec is not None:
+            if not callable(getattr(self.token, 'is_revoked', None)):
+                raise NotImplementedError(
+                    "token object must implement is_revoked method."
+                )
+            if self.token_cache is None:
+                # Without one, every signed validation would ask the store.
+                raise ValueError(
+                    'Checking signed tokens for revocation needs a token cache.'
+                )
+            self.check_signed_revocations = True
+
+        if negative_cache:
+            self.rejected_tokens = NegativeCache(**negative_cache)
+            self.rejected_clients = NegativeCache(**negative_cache)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        hook = getattr(self.request_validator_cls, name)
+        return hook.__get__(self, type(self)) if callable(hook) else hook
+
+    def _shared(self, key, request, fn, *args, **kwargs):
+        # Call a backend, coalescing with identical in-flight calls when
+        # single_flight is enabled. Attributes the backend sets on the
+        # leader's request are copied onto every waiter's request.
+        if self.single_flight is None:
+            return _resolve(fn(*args, **kwargs))
+
+        def call():
+            since = capture_attrs(request)
+            result = _resolve(fn(*args, **kwargs))
+            return result, capture_attrs(request, since=since)
+
+        result, attrs = self.single_flight.do(key, call)
+        for k, v in attrs:
+            setattr(request, k, v)
+        return result
+
+    async def _shared_async(self, key, request, fn, *args, **kwargs):
+        if self.single_flight is None:
+            return await _call_async(fn, *args, **kwargs)
+
+        async def call():
+            since = capture_attrs(request)
+            result = await _call_async(fn, *args, **kwargs)
+            return result, capture_attrs(request, since=since)
+
+        result, attrs = await self.single_flight.do_async(key, call)
+        for k, v in attrs:
+            setattr(request, k, v)
+        return result
 
     def get_default_redirect_uri(self, client_id, request, *args, **kwargs):
         """Get the default redirect URI for the client.
@@ -63,7 +181,13 @@ class ValidatorService(ReqVal):
             - Authorization Code Grant
             - Implicit Grant
         """
-        return self.client.get_redirect_uri(client_id, request, *args, **kwargs)
+        if self.client_registry is not None:
+            record = self.client_registry.get(client_id, request)
+            return record.default_redirect_uri if record is not None else None
+
+        return _resolve(
+            self.client.get_redirect_uri(client_id, request, *args, **kwargs)
+        )
 
     def get_default_scopes(self, client_id, request, *args, **kwargs):
         """Get the default scopes for the client.
@@ -78,7 +202,13 @@ class ValidatorService(ReqVal):
             - Resource Owner Password Credentials Grant
             - Client Credentials grant
         """
-        return self.client.get_scopes(client_id, request, *args, **kwargs)
+        if self.client_registry is not None:
+            record = self.client_registry.get(client_id, request)
+            return list(record.scopes) if record is not None else []
+
+        return _resolve(
+            self.client.get_scopes(client_id, request, *args, **kwargs)
+        )
 
     def revoke_token(self, token, token_type_hint, request, *args, **kwargs):
         """Revoke an access or refresh token.
@@ -87,10 +217,76 @@ class ValidatorService(ReqVal):
         :param token_type_hint: access_token or refresh_token.
         :param request: The HTTP Request (oauthlib.common.Request)
 
+        With ``write_behind`` enabled the revocation is queued and written
+        through ``token.revoke_many`` in a later batch; it takes effect for
+        local validation immediately.
+
         Method is used by:
             - Revocation Endpoint
         """
-        self.token.revoke(token, token_type_hint, request, *args, **kwargs)
+        started = self.metrics.start()
+        if self.write_behind is not None:
+            self.write_behind.revoke(token, token_type_hint, request, *args, **kwargs)
+        else:
+            _resolve(self.token.revoke(token, token_type_hint, request, *args, **kwargs))
+        self.metrics.lap('revocation', started)
+
+        if self.token_codec is not None:
+            self.token_codec.revoke(token)
+
+        if self.token_cache is not None:
+            self.token_cache.invalidate(token)
+
+    def revoke_tokens(self, request, client_id=None, user=None, scope=None,
+                      batch_size=1000):
+        """Revoke every token of a client, user and/or scope in batches.
+
+        Tokens are found through the token backend's index lookup
+        ``find_tokens(client_id=None, user=None, scope=None)`` and revoked
+        with one ``revoke_many`` call per batch. Cached validations of a
+        batch are dropped in one step once the backend call returns. With
+        ``write_behind`` the queue is flushed first, and saves still queued
+        are matched from the queue and revoked through it.
+
+        :param request: The HTTP Request (oauthlib.common.Request)
+        :rtype: Generator of ``(revoked so far, total)`` tuples, one per batch.
+        """
+        if client_id is None and user is None and scope is None:
+            raise ValueError('A client_id, user or scope is required.')
+
+        pending = set()
+        if self.write_behind is not None:
+            # Queued saves of the affected tokens must land before they are
+            # looked up, or they would be written again after the purge.
+            # Saves queued meanwhile are picked from the queue itself.
+            self.write_behind.flush()
+            pending = set(self.write_behind.find_tokens(
+                client_id=client_id, user=user, scope=scope))
+
+        tokens = list(_resolve(
+            self.token.find_tokens(client_id=client_id, user=user, scope=scope)
+        ))
+        tokens.extend(pending.difference(tokens))
+        total = len(tokens)
+
+        for start in range(0, total, batch_size):
+            started = self.metrics.start()
+            batch = tokens[start:start + batch_size]
+            _resolve(self.token.revoke_many(
+                [(token, 'access_token', request) for token in batch]
+            ))
+            for token in pending.intersection(batch):
+                # Queued behind its save, so the save cannot restore it.
+                self.write_behind.revoke(token, 'access_token', request)
+
+            if self.token_codec is not None:
+                for token in batch:
+                    self.token_codec.revoke(token)
+            if self.token_cache is not None:
+                self.token_cache.invalidate_many(batch)
+
+            self.metrics.lap('revocation', started)
+            yield start + len(batch), total
 
     def save_bearer_token(self, token, request, *args, **kwargs):
         """Persist the Bearer token.
@@ -121,6 +317,10 @@ class ValidatorService(ReqVal):
         :param request: The HTTP Request (oauthlib.common.Request)
         :rtype: The default redirect URI for the client
 
+        With ``write_behind`` enabled the token is queued and written through
+        ``token.save_many`` in a later batch; it validates locally as soon as
+        this method returns.
+
         Method is used by all core grant types issuing Bearer tokens:
             - Authorization Code Grant
             - Implicit Grant
@@ -128,7 +328,17 @@ class ValidatorService(ReqVal):
             - Client Credentials grant
         """
 
-        self.token.save(token, request, *args, **kwargs)
+        started = self.metrics.start()
+        if self.write_behind is not None:
+            self.write_behind.save(token, request, *args, **kwargs)
+        else:
+            _resolve(self.token.save(token, request, *args, **kwargs))
+        self.metrics.lap('token_save', started)
+
+        if self.token_cache is not None:
+            self.token_cache.discard(token['access_token'])
+        if self.rejected_tokens is not None:
+            self.rejected_tokens.discard(token['access_token'])
 
     def validate_bearer_token(self, token, scopes, request):
         """Ensure the Bearer token is valid and authorized access to scopes.
@@ -168,17 +378,269 @@ class ValidatorService(ReqVal):
         in all protected views as keyword arguments.
 
         :param token: Unicode Bearer token
-        :param scopes: List of scopes (defined by you)
+        :param scopes: List or space separated string of scopes (defined by
+                       you), or a ScopeRequirement compiled by
+                       ``scope_registry``; the backend always receives a list,
+                       all of which the token must hold. Scopes no route
+                       requires are never interned and fail the check.
+                       Any-of requirements are validated without scopes and
+                       checked against request.scopes, or one scope at a
+                       time when the backend does not set it. A backend
+                       rejecting a valid token for a missing scope may set
+                       request.scopes to its scopes, so ``auth_required``
+                       can answer ``insufficient_scope``.
         :param request: The HTTP Request (oauthlib.common.Request)
         :rtype: True or False
 
+        Successful validations are kept in ``token_cache``, when one is
+        configured, so repeated calls for a hot token skip the backend.
+        Likewise, tokens the backend rejected are kept in
+        ``rejected_tokens`` for a few seconds, until they are saved.
+        Tokens issued by ``token_codec`` are verified from their signature
+        and claims. With ``check_signed_revocations`` set, the token
+        backend's ``is_revoked(token, request)`` is then asked whether the
+        token was revoked (elsewhere, or before a restart); answers are kept
+        in ``token_cache`` and, for revoked tokens, until they expire.
+
         Method is indirectly used by all core Bearer token issuing grant types:
             - Authorization Code Grant
             - Implicit Grant
             - Resource Owner Password Credentials Grant
             - Client Credentials Grant
         """
-        return self.token.validate(token, scopes, request)
+        required = self.scope_registry.lookup(scopes)
+        if required is None:
+            return False
+        valid = self._validate_bearer_token_locally(token, required, request)
+        if valid is not None:
+            return valid
+
+        if self.check_signed_revocations and self.token_codec.owns(token):
+            return self._signed_revocation_result(token, self._shared(
+                ('is_revoked', token),
+                request,
+                self.token.is_revoked,
+                token,
+                request
+            ))
+
+        stamp = self._stamp_rejection(token)
+        since = capture_attrs(request)
+        valid = self._shared(
+            ('validate', token, required.key),
+            request,
+            self.token.validate,
+            token,
+            _backend_scopes(required),
+            request
+        )
+        if valid and _needs_any_check(required):
+            valid = self._granted_any(token, required, request, since)
+        if valid and self.token_cache is not None:
+            self.token_cache.set(token, required, request, since)
+        elif not valid and stamp is not None:
+            self._reject_token(token, required, stamp, request, since)
+        return valid
+
+    async def validate_bearer_token_async(self, token, scopes, request):
+        """Awaitable variant of :meth:`validate_bearer_token`.
+
+        ``token.validate`` may be a coroutine function; synchronous
+        backends are run in the event loop's default executor.
+        """
+        required = self.scope_registry.lookup(scopes)
+        if required is None:
+            return False
+        valid = self._validate_bearer_token_locally(token, required, request)
+        if valid is not None:
+            return valid
+
+        if self.check_signed_revocations and self.token_codec.owns(token):
+            return self._signed_revocation_result(token, await self._shared_async(
+                ('is_revoked', token),
+                request,
+                self.token.is_revoked,
+                token,
+                request
+            ))
+
+        stamp = self._stamp_rejection(token)
+        since = capture_attrs(request)
+        valid = await self._shared_async(
+            ('validate', token, required.key),
+            request,
+            self.token.validate,
+            token,
+            _backend_scopes(required),
+            request
+        )
+        if valid and _needs_any_check(required):
+            valid = await self._granted_any_async(token, required, request, since)
+        if valid and self.token_cache is not None:
+            self.token_cache.set(token, required, request, since)
+        elif not valid and stamp is not None:
+            self._reject_token(token, required, stamp, request, since)
+        return valid
+
+    def _granted_any(self, token, required, request, since):
+        # Backends check all-of, so an any-of requirement is validated
+        # without scopes and checked here against the scopes the backend
+        # reported, or else one scope at a time.
+        granted = dict(capture_attrs(request, since=since)).get('scopes')
+        if granted is not None:
+            return required.allows(self.scope_registry.mask(granted))
+        return any(
+            _resolve(self.token.validate(token, [scope], request))
+            for scope in required.scopes
+        )
+
+    async def _granted_any_async(self, token, required, request, since):
+        granted = dict(capture_attrs(request, since=since)).get('scopes')
+        if granted is not None:
+            return required.allows(self.scope_registry.mask(granted))
+        for scope in required.scopes:
+            if await _call_async(self.token.validate, token, [scope], request):
+                return True
+        return False
+
+    def introspect_tokens(self, tokens, request):
+        """Look up a batch of tokens for introspection.
+
+        Tokens known locally (signed, pending in ``write_behind`` or cached
+        with their scopes and expiry) are answered without the backend; the
+        rest are fetched with one ``token.introspect_many(tokens)`` call,
+        which returns a mapping of active token to its ``client_id``,
+        ``user``, ``scopes`` and ``expires_at``. Backends without it get one
+        ``validate`` call per token.
+
+        :param tokens: List of Unicode Bearer tokens
+        :param request: The HTTP Request (oauthlib.common.Request)
+        :rtype: List with a dict of attributes per active token, in order,
+                and None for inactive ones.
+        """
+        started = self.metrics.start()
+        results = {}
+        unknown = []
+        for token in tokens:
+            if token in results:
+                continue
+            attrs = SimpleNamespace()
+            valid = self._validate_bearer_token_locally(token, _NO_SCOPES, attrs)
+            if valid is None or (valid and not hasattr(attrs, 'expires_at')):
+                unknown.append(token)
+            else:
+                results[token] = vars(attrs) if valid else None
+
+        if unknown:
+            bulk = getattr(self.token, 'introspect_many', None)
+            if bulk is not None:
+                found = _resolve(bulk(unknown))
+                for token in unknown:
+                    results[token] = found.get(token)
+            else:
+                for token in unknown:
+                    attrs = SimpleNamespace()
+                    valid = _resolve(self.token.validate(token, [], attrs))
+                    results[token] = vars(attrs) if valid else None
+
+        self.metrics.lap('introspection', started)
+        return [results[token] for token in tokens]
+
+    def bearer_token_lacks_scope(self, token, request):
+        """Whether a token that just failed a scoped validation is valid
+        without those scopes.
+
+        Decided without calling the backend: from ``request.scopes``, which
+        a backend may set to the token's scopes when it rejects the token
+        for lacking one, or from what is known locally (signed claims,
+        ``write_behind``, ``token_cache``, or ``rejected_tokens`` recording
+        such a rejection). Otherwise False.
+
+        :param token: Unicode Bearer token
+        :param request: The request the failed validation was given
+        :rtype: True or False
+        """
+        if token is None:
+            return False
+        if 'scopes' in vars(request):
+            return True
+        if self.rejected_tokens is not None and \
+                self.rejected_tokens.marked(token, _UNDER_SCOPED):
+            return True
+        return bool(self._validate_bearer_token_locally(
+            token, _NO_SCOPES, SimpleNamespace()))
+
+    def _validate_bearer_token_locally(self, token, required, request):
+        # True or False when the answer is known without the backend,
+        # None when the backend has to be asked.
+        codec = self.token_codec
+        if codec is not None and codec.owns(token):
+            claims = codec.decode(token)
+            if claims is None or \
+                    not self._validate_claims(claims, required, request):
+                return False
+            if not self.check_signed_revocations:
+                return True
+            return self._signed_revocation_known(token)
+
+        if self.write_behind is not None:
+            valid = self.write_behind.lookup(token, required, request)
+            if valid is not None:
+                return valid
+
+        if self.token_cache is not None and \
+                self.token_cache.get(token, required, request):
+            return True
+
+        if self.rejected_tokens is not None and token is not None and \
+                self.rejected_tokens.rejects(token, _rejection_key(required)):
+            return False
+        return None
+
+    def _stamp_rejection(self, token):
+        if self.rejected_tokens is None or token is None:
+            return None
+        return self.rejected_tokens.stamp(token)
+
+    def _reject_token(self, token, required, stamp, request, since):
+        self.rejected_tokens.add(token, _rejection_key(required), stamp)
+        if required.mask and \
+                any(k == 'scopes' for k, _ in capture_attrs(request, since=since)):
+            # Valid but lacking a scope; see bearer_token_lacks_scope.
+            self.rejected_tokens.add(token, _UNDER_SCOPED, stamp)
+
+    def _signed_revocation_known(self, token):
+        # True when a signed token is known not to be revoked (pending
+        # write, cached check), False for a pending revocation, otherwise
+        # None: ``token.is_revoked`` has to be asked.
+        if self.write_behind is not None:
+            pending = self.write_behind.lookup(token, _NO_SCOPES)
+            if pending is not None:
+                return pending
+        if self.token_cache is not None and \
+                self.token_cache.get(token, _NO_SCOPES):
+            return True
+        return None
+
+    def _signed_revocation_result(self, token, revoked):
+        if revoked:
+            # Remembered in process until the token expires.
+            self.token_codec.revoke(token)
+            return False
+        if self.token_cache is not None:
+            self.token_cache.set(token, _NO_SCOPES)
+        return True
+
+    def _validate_claims(self, claims, required, request):
+        if not self.token_codec.is_active(claims):
+            return False
+        if not required.allows(self.scope_registry.mask(claims['scp'])):
+            return False
+
+        request.client_id = claims['cid']
+        request.scopes = claims['scp']
+        request.expires_at = claims['exp']
+        return True
 
     def validate_client_id(self, client_id, request, *args, **kwargs):
         """Ensure client_id belong to a valid and active client.
@@ -190,11 +652,49 @@ class ValidatorService(ReqVal):
         :param request: oauthlib.common.Request
         :rtype: True or False
 
+        With a ``client_registry`` the cached registration is used and
+        request.client is set to its ClientRecord. Rejected client ids are
+        kept in ``rejected_clients``, when configured, until they expire or
+        the client is invalidated.
+
         Method is used by:
             - Authorization Code Grant
             - Implicit Grant
         """
-        return self.client.validate_client_id(client_id, request, *args, **kwargs)
+        rejected = self.rejected_clients
+        if rejected is None or client_id is None:
+            return self._validate_client_id(client_id, request, *args, **kwargs)
+
+        if rejected.rejects(client_id):
+            return False
+        stamp = rejected.stamp(client_id)
+        valid = self._validate_client_id(client_id, request, *args, **kwargs)
+        if not valid:
+            rejected.add(client_id, stamp=stamp)
+        return valid
+
+    def _validate_client_id(self, client_id, request, *args, **kwargs):
+        if self.client_registry is not None:
+            return self._accept_client(
+                self.client_registry.get(client_id, request),
+                request
+            )
+
+        return self._shared(
+            ('validate_client_id', client_id),
+            request,
+            self.client.validate_client_id,
+            client_id,
+            request,
+            *args,
+            **kwargs
+        )
+
+    def _accept_client(self, record, request):
+        if record is None or not record.active:
+            return False
+        request.client = record
+        return True
 
 
     def authenticate_client(self, request, *args, **kwargs):
@@ -220,7 +720,53 @@ class ValidatorService(ReqVal):
         .. _`HTTP Basic Authentication Scheme`: http://tools.ietf.org/html/rfc1945#section-11.1
         """
 
-        return self.client.validate_client_id(request, *args, **kwargs)
+        return self.validate_client_id(
+            request.client_id,
+            request,
+            *args,
+            **kwargs
+        )
+
+    async def authenticate_client_async(self, request, *args, **kwargs):
+        """Awaitable variant of :meth:`authenticate_client`."""
+        rejected = self.rejected_clients
+        client_id = request.client_id
+        if rejected is None or client_id is None:
+            return await self._authenticate_client_async(request, *args, **kwargs)
+
+        if rejected.rejects(client_id):
+            return False
+        stamp = rejected.stamp(client_id)
+        valid = await self._authenticate_client_async(request, *args, **kwargs)
+        if not valid:
+            rejected.add(client_id, stamp=stamp)
+        return valid
+
+    async def _authenticate_client_async(self, request, *args, **kwargs):
+        registry = self.client_registry
+        if registry is not None:
+            record = registry.peek(request.client_id)
+            if record is None:
+                data = await self._shared_async(
+                    ('get_client', request.client_id),
+                    request,
+                    self.client.get_client,
+                    request.client_id,
+                    request
+                )
+                if data is not None:
+                    record = registry.set(request.client_id, data)
+            return self._accept_client(record, request)
+
+        return await self._shared_async(
+            ('validate_client_id', request.client_id),
+            request,
+            self.client.validate_client_id,
+            request.client_id,
+            request,
+            *args,
+            **kwargs
+        )
 
 
     def validate_redirect_uri(self, client_id, redirect_uri, request, *args, **kwargs):
@@ -238,14 +784,20 @@ class ValidatorService(ReqVal):
             - Authorization Code Grant
             - Implicit Grant
         """
+        if self.client_registry is not None:
+            return self.client_registry.match_redirect_uri(
+                client_id,
+                redirect_uri,
+                request
+            )
 
-        return self.client.validate_redirect_uri(
+        return _resolve(self.client.validate_redirect_uri(
             client_id,
             redirect_uri,
             request,
             *args,
             **kwargs
-        )
+        ))
 
     def validate_response_type(self, client_id, response_type, client, request, *args, **kwargs):
         """Ensure client is authorized to use the response_type requested.
@@ -260,15 +812,18 @@ class ValidatorService(ReqVal):
             - Authorization Code Grant
             - Implicit Grant
         """
+        if self.client_registry is not None:
+            record = self.client_registry.get(client_id, request)
+            return record is not None and response_type in record.response_types
 
-        return self.client.validate_response_type(
+        return _resolve(self.client.validate_response_type(
             client_id,
             response_type,
             client,
             request,
             *args,
             **kwargs
-        )
+        ))
 
     def validate_scopes(self, client_id, scopes, client, request, *args, **kwargs):
         """Ensure the client is authorized access to requested scopes.
@@ -285,15 +840,39 @@ class ValidatorService(ReqVal):
             - Resource Owner Password Credentials Grant
             - Client Credentials Grant
         """
+        if self.client_registry is not None:
+            record = self.client_registry.get(client_id, request)
+            return record is not None and record.allowed_scopes.issuperset(scopes)
 
-        self.client.validate_scopes(
+        return _resolve(self.client.validate_scopes(
             client_id,
             scopes,
             client,
             request,
             *args,
             **kwargs
-        )
+        ))
+
+
+_NO_SCOPES = ScopeRequirement(0, ALL, ())
+
+
+def _backend_scopes(required):
+    # The scopes passed to ``token.validate``, which checks all of them.
+    return required.scopes if required.match == ALL else []
+
+
+def _needs_any_check(required):
+    return required.match != ALL and required.mask
+
+
+# Negative-cache key of tokens the backend found valid but under-scoped.
+_UNDER_SCOPED = object()
+
+
+def _rejection_key(required):
+    # A token rejected without asking for any scope is invalid outright.
+    return required.key if required.mask else None
 
 
 class AuthInterface(object):
@@ -304,6 +883,9 @@ class AuthInterface(object):
     def authorize_token(self, *args, **kwargs):
         raise NotImplementedError('Must be implemented by child')
 
+    def token_lacks_scope(self, *args, **kwargs):
+        raise NotImplementedError('Must be implemented by child')
+
     def validate_auth_request(self, *args, **kwargs):
         raise NotImplementedError('Must be implemented by child')
 
@@ -313,187 +895,949 @@ class AuthInterface(object):
 
 class OAuthService(AuthInterface):
 
-    auth_request_cls = OAuthlibRequest
-    validator = server = None
+    auth_request_cls = _LazyImport('oauthlib.common', 'Request')
+    server_cls = _LazyImport('oauthlib.oauth2', 'MobileApplicationServer')
+    validator = token_generator = None
+    metrics = StageMetrics()
 
     def __init__(self, user_cls, client_cls, token_cls, **kwargs):
 
+            token_generator = kwargs.get('token_generator')
+            if token_generator is not None and token_generator != 'buffered' \
+                    and not callable(token_generator):
+                raise ValueError(
+                    "token_generator must be None, 'buffered' or a callable, "
+                    "not %r." % (token_generator,)
+                )
+
+            scope_registry = ScopeRegistry()
+            token_cache = None
+            if kwargs.get('token_cache_ttl') and kwargs.get('shared_token_cache'):
+                from .sharedcache import SharedTokenCache
+                token_cache = SharedTokenCache(
+                    kwargs['shared_token_cache'],
+                    slots=kwargs.get('shared_token_cache_slots', 65536),
+                    ttl=kwargs['token_cache_ttl'],
+                    scope_registry=scope_registry
+                )
+            elif kwargs.get('token_cache_ttl'):
+                token_cache = TokenCache(
+                    maxsize=kwargs.get('token_cache_size', 10000),
+                    ttl=kwargs['token_cache_ttl']
+                )
+
+            self.metrics = kwargs.get('metrics') or self.metrics
+
+            single_flight = None
+            if kwargs.get('single_flight'):
+                single_flight = SingleFlight(
+                    timeout=kwargs.get('single_flight_timeout')
+                )
+
+            token_codec = None
+            if kwargs.get('signed_token_keys'):
+                token_codec = SignedTokenCodec(
+                    kwargs['signed_token_keys'],
+                    active_key_id=kwargs.get('signed_token_key_id')
+                )
+
             self.validator = ValidatorService(
-                user=user_cls(),
-                client=client_cls(),
-                token=token_cls()
+                user=user_cls() if user_cls is not None else None,
+                client=client_cls() if client_cls is not None else None,
+                token=token_cls() if token_cls is not None else None,
+                token_cache=token_cache,
+                token_codec=token_codec,
+                scope_registry=scope_registry,
+                write_behind=kwargs.get('write_behind'),
+                client_cache=kwargs.get('client_cache'),
+                negative_cache=kwargs.get('negative_cache'),
+                check_signed_revocations=kwargs.get('signed_token_check_revoked'),
+                single_flight=single_flight,
+                metrics=self.metrics
             )
 
-            self.server = MobileApplicationServer(self.validator)
+            if token_generator == 'buffered':
+                token_generator = BufferedTokenGenerator()
+            self.token_generator = token_codec.generate if token_codec \
+                else token_generator
+
+    @cached_property
+    def server(self):
+        # Built on the first authorization or revocation request, so apps
+        # that only validate tokens never import oauthlib's grant machinery.
+        return self.server_cls(
+            self.validator,
+            token_generator=self.token_generator
+        )
+
+    def _to_auth_req(self, request):
+        # Returns the converted request and a start time for the next stage.
+        started = self.metrics.start()
+        request.auth_fields
+        started = self.metrics.lap('parse', started)
+        auth_request = request.to_auth_req()
+        return auth_request, self.metrics.lap('to_auth_req', started)
 
     def authorize_client(self, request, *args, **kwargs):
-        request = request.to_auth_request()
-        return self.validator.authenticate_client(
+        request, started = self._to_auth_req(request)
+        authorized = self.validator.authenticate_client(
                 request,
                 *args,
                 **kwargs
         )
+        self.metrics.lap('client_auth', started)
+        return authorized
 
-    def authorize_token(self, request, *args, **kwargs):
+    def authorize_token(self, request, scopes=None, *args, **kwargs):
         token = request.token
-        request = request.to_auth_request()
-        return self.validator.validate_bearer_token(
+        request, started = self._to_auth_req(request)
+        authorized = self.validator.validate_bearer_token(
                 token,
-                request.scopes,
+                scopes if scopes is not None else request.scope,
                 request,
                 *args,
                 **kwargs
         )
-
-    def validate_auth_request(self, request, *args, **kwargs):
-        user = request.user
-        request = request.to_auth_request()
-        return self.server.create_authorization_response(
-                url,
-                http_methed=request.http_method,
-                body=request.body,
-                headers=request.headers,
-                scopes=request.scope,
-                credentials={'user', user}
+        self.metrics.lap('token_validation', started)
+        return authorized
+
+    def token_lacks_scope(self, request):
+        # Only consulted after authorize_token failed, on the same request.
+        return self.validator.bearer_token_lacks_scope(
+                request.token,
+                request.to_auth_req()
         )
 
-    def validate_revoke_request(self, request,*args, **kwargs):
-        request = request.to_auth_req()
-        return self.server.create_revocation_response(
-                url,
-                http_methed=request.http_method,
-                body=request.body,
+    async def authorize_client_async(self, request, *args, **kwargs):
+        request, started = self._to_auth_req(request)
+        authorized = await self.validator.authenticate_client_async(
+                request,
+                *args,
+                **kwargs
         )
+        self.metrics.lap('client_auth', started)
+        return authorized
 
+    async def authorize_token_async(self, request, scopes=None, *args, **kwargs):
+        token = request.token
+        request, started = self._to_auth_req(request)
+        authorized = await self.validator.validate_bearer_token_async(
+                token,
+                scopes if scopes is not None else request.scope,
+                request,
+                *args,
+                **kwargs
+        )
+        self.metrics.lap('token_validation', started)
+        return authorized
 
-class OAuthRequest(Request):
+    def validate_auth_request(self, request, *args, **kwargs):
+        user = request.user
+        scopes = split_scopes(request.scope)
+        request, started = self._to_auth_req(request)
+        request.scopes = list(scopes) if scopes else None
+        request.user = user
+        response = self._endpoint(_authorize, request)
+        self.metrics.lap('authorization', started)
+        return response
+
+    def revoke_tokens(self, request, client_id=None, user=None, scope=None,
+                      batch_size=1000):
+        request = request.to_auth_req()
+        return self.validator.revoke_tokens(
+                request,
+                client_id=client_id,
+                user=user,
+                scope=scope,
+                batch_size=batch_size
+        )
 
-    authorized = access_token = redirect_uri = scope = None
-    response_type = state = token = client_id = user = _json_data = None
+    def introspect_tokens(self, request, tokens):
+        request = request.to_auth_req()
+        return self.validator.introspect_tokens(tokens, request)
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._json_data = self.get_json();
-        self.scope = self.form.get('scope') or self._json_data.get('scope')
-        self.state = self.form.get('state') or self._json_data.get('state')
-        self.redirect_uri = self.form.get('redirect-uri') or self._json_data.get('redirect-uri')
-        self.response_type = self.form.get('response-type') or self._json_data.get('response-type')
-        self.client_id = self.form.get('client-id') or self._json_data.get('client-id') or self.headers.get('client-id')
-        self.token = self.headers.get('Authorization')[7:] if self.headers.get('Authorization') else None;
+    def validate_revoke_request(self, request,*args, **kwargs):
+        request, _ = self._to_auth_req(request)
+        return self._endpoint(_revoke, request)
+
+    def _endpoint(self, handler, request):
+        # oauthlib's create_*_response methods build their own Request from
+        # the uri, body and headers; drive the same steps with the shared one
+        # instead, keeping their availability and error handling.
+        from oauthlib.oauth2.rfc6749.endpoints.base import \
+            catch_errors_and_unavailability
+        return catch_errors_and_unavailability(handler)(self.server, request)
+
+
+def _authorize(server, request):
+    # AuthorizationEndpoint.create_authorization_response past its Request.
+    handler = server.response_types.get(
+        request.response_type, server.default_response_type_handler)
+    return handler.create_authorization_response(
+        request, server.default_token_type)
+
+
+def _revoke(server, request):
+    # RevocationEndpoint.create_revocation_response past its Request.
+    from oauthlib.oauth2.rfc6749.errors import OAuth2Error
+    try:
+        server.validate_revocation_request(request)
+    except OAuth2Error as e:
+        return {}, e.json, e.status_code
+    server.request_validator.revoke_token(
+        request.token, request.token_type_hint, request)
+    body = request.callback + '()' if request.callback else None
+    return {}, body, 200
 
-    def to_auth_req(self):
 
-        req_body = {
+class OAuthRequest(Request):
+    """Request class exposing the OAuth fields of the incoming request.
+
+    Every field is extracted on first access and cached for the rest of the
+    request, so routes that never touch them never buffer or parse the body.
+    Only urlencoded and JSON bodies are consulted; multipart and other
+    streamed bodies are left untouched unless the view already parsed them.
+    """
+
+    authorized = access_token = user = None
+
+    def _body_field(self, name):
+        if self.mimetype == 'application/x-www-form-urlencoded' \
+                or 'form' in self.__dict__:
+            value = self.form.get(name)
+            if value is not None:
+                return value
+        if self.is_json:
+            return self._json_data.get(name)
+        return None
+
+    @cached_property
+    def _json_data(self):
+        data = self.get_json(silent=True)
+        return data if isinstance(data, dict) else {}
+
+    @cached_property
+    def scope(self):
+        return self._body_field('scope')
+
+    @cached_property
+    def state(self):
+        return self._body_field('state')
+
+    @cached_property
+    def redirect_uri(self):
+        return self._body_field('redirect-uri')
+
+    @cached_property
+    def response_type(self):
+        return self._body_field('response-type')
+
+    @cached_property
+    def client_id(self):
+        return self._body_field('client-id') or self.headers.get('client-id')
+
+    @cached_property
+    def token(self):
+        auth = self.headers.get('Authorization')
+        return auth[7:] if auth else None
+
+    @cached_property
+    def revoked_token(self):
+        # The token named in a revocation request body, as opposed to the
+        # bearer token authorizing the request.
+        return self._body_field('token')
+
+    @cached_property
+    def token_type_hint(self):
+        return self._body_field('token_type_hint')
+
+    @cached_property
+    def auth_fields(self):
+        """The OAuth parameters of the request, keyed by their oauthlib names."""
+        fields = {
             'client_id': self.client_id,
             'state': self.state,
             'response_type': self.response_type,
-            'scopes': self.scope
+            'redirect_uri': self.redirect_uri,
+            'scope': self.scope,
+            'token': self.revoked_token,
+            'token_type_hint': self.token_type_hint
         }
+        return dict((k, v) for k, v in fields.items() if v is not None)
+
+    @cached_property
+    def auth_request(self):
+        """The oauthlib request for this request, built once and shared by
+        every check and endpoint that handles it."""
+        return _auth_request_adapter(OAuthService.auth_request_cls)(self)
+
+    def to_auth_req(self):
+        return self.auth_request
+
 
-        return OAuthService.auth_request_cls(
-            self.url,
-            http_method=self.method,
-            body=req_body,
-            headers=self.headers
+_adapters = {}
+
+
+def _auth_request_adapter(base):
+    # The adapter subclasses the configured oauthlib request class, which is
+    # only imported on first use, so it is created (once) here.
+    adapter = _adapters.get(base)
+    if adapter is None:
+        adapter = _adapters[base] = type(
+            'AuthRequestAdapter',
+            (_AuthRequestAdapter, base),
+            {}
         )
+    return adapter
+
+
+class _AuthRequestAdapter(object):
+    """oauthlib request reading straight from an :class:`OAuthRequest`.
+
+    oauthlib's constructor copies the headers into a new dict and re-parses
+    the body; the adapter instead keeps werkzeug's headers, the request's
+    ``auth_fields`` and its query args, and looks parameters up in them on
+    access, headers first as oauthlib does.
+    """
+
+    def __init__(self, request):
+        self.uri = request.url
+        self.http_method = request.method
+        self.headers = request.headers
+        self.body = request.auth_fields
+        self.oauth_params = []
+        self._args = request.args
+
+    @property
+    def decoded_body(self):
+        return list(self.body.items())
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        value = self.headers.get(name)
+        if value is None:
+            value = self.body.get(name)
+        if value is None:
+            value = self._args.get(name)
+        return value
+
+
+def _render_error(status, error, description, challenge=None):
+    headers = [
+        ('Content-Type', 'application/json'),
+        ('Cache-Control', 'no-store'),
+        ('Pragma', 'no-cache'),
+    ]
+    if challenge is not None:
+        headers.append(('WWW-Authenticate', challenge))
+    body = json.dumps({'error': error, 'error_description': description})
+    return body.encode('utf-8'), status, tuple(headers)
 
 
 class OAuthResponse(Response):
 
+    #: Fixed outcomes rendered once at import, as (body, status, headers).
+    PRERENDERED = {
+        'invalid_token': _render_error(
+            401, 'invalid_token',
+            'The access token is missing, invalid, expired or revoked.',
+            'Bearer error="invalid_token"'
+        ),
+        'insufficient_scope': _render_error(
+            403, 'insufficient_scope',
+            'The access token lacks a scope this resource requires.',
+            'Bearer error="insufficient_scope"'
+        ),
+        'invalid_client': _render_error(
+            401, 'invalid_client', 'Client authentication failed.'
+        ),
+        'revoked': (b'', 200, (('Cache-Control', 'no-store'),
+                               ('Pragma', 'no-cache'))),
+    }
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def from_auth_response():
-        # return instance of Authentication Token Engine's request class
-        pass
+    @classmethod
+    def from_auth_response(cls, headers, body, status):
+        """Response for oauthlib's ``(headers, body, status)`` result.
+
+        The body oauthlib rendered is sent as is, as JSON unless oauthlib
+        set a Content-Type (its error bodies come with no headers at all).
+        """
+        response = cls(body, status=status, headers=headers)
+        if body and not any(k.lower() == 'content-type' for k in headers or ()):
+            response.mimetype = 'application/json'
+        return response
+
+    @classmethod
+    def prerendered(cls, name):
+        """Response for one of the fixed outcomes in :attr:`PRERENDERED`."""
+        body, status, headers = cls.PRERENDERED[name]
+        return cls(body, status=status, headers=headers)
 
 
 class OAuthApi(object):
 
+    admission = policies = None
+
     def __init__(self, user, token, client, **kwargs):
 
+        self.policies = kwargs.get('policies')
+        if self.policies is None:
+            self.policies = AuthPolicyRegistry()
+
+        if kwargs.get('rate_limit') or kwargs.get('max_concurrency'):
+            self.admission = AdmissionControl(
+                rate=kwargs.get('rate_limit'),
+                burst=kwargs.get('rate_limit_burst'),
+                max_concurrency=kwargs.get('max_concurrency'),
+                retry_after=kwargs.get('retry_after')
+            )
+
         self.auth_service = OAuthService(
             user,
             client,
-            token
+            token,
+            **kwargs
+        )
+
+    @property
+    def token_cache(self):
+        return self.auth_service.validator.token_cache
+
+
+    def auth_required(self, f=None, client_auth=None, token_auth=None, scope=None, scope_match=ALL, reject=False, *args, **kwargs):
+        """Protect a view with client and/or bearer token authentication.
+
+        Can be applied directly or with arguments::
+
+            @auth_api.auth_required(client_auth=True, token_auth=True,
+                                    scope=['users'])
+            def get_users():
+                ...
+
+        ``scope`` may be a list or a space separated string and is compiled
+        to a bitset once, here; ``scope_match`` selects whether the token
+        needs ``'all'`` or ``'any'`` of the scopes.
+
+        ``request.authorized`` is True inside the view when every requested
+        check passed. With ``reject`` the view is only called for authorized
+        requests; others get a pre-rendered ``invalid_client``,
+        ``invalid_token`` or, for a valid token lacking ``scope``,
+        ``insufficient_scope`` error. Coroutine views are wrapped by
+        :meth:`async_auth_required`.
+
+        With ``admission`` configured, requests over their client's rate or
+        the concurrency cap are rejected with a 429 or 503 before the body
+        is read or any backend is called.
+
+        The options are compiled into an :class:`AuthPolicy`, recorded in
+        ``policies``, and a wrapper that runs only the checks it asks for.
+        """
+        if f is None:
+            return partial(
+                self.auth_required,
+                client_auth=client_auth,
+                token_auth=token_auth,
+                scope=scope,
+                scope_match=scope_match,
+                reject=reject
+            )
+
+        if inspect.iscoroutinefunction(f):
+            return self.async_auth_required(
+                f, client_auth, token_auth, scope, scope_match, reject
+            )
+
+        policy = AuthPolicy(
+            f,
+            client_auth=client_auth,
+            token_auth=token_auth,
+            scope=self._compile_scope(scope, scope_match),
+            reject=reject
         )
+        return self._register(self._admit(self._compile(f, policy)), policy)
+
+    def async_auth_required(self, f=None, client_auth=None, token_auth=None, scope=None, scope_match=ALL, reject=False, *args, **kwargs):
+        """Variant of :meth:`auth_required` for ``async def`` views.
 
+        Backends are awaited without blocking the event loop; when both
+        client and token authentication are requested they run concurrently.
+        """
+        if f is None:
+            return partial(
+                self.async_auth_required,
+                client_auth=client_auth,
+                token_auth=token_auth,
+                scope=scope,
+                scope_match=scope_match,
+                reject=reject
+            )
 
-    def auth_required(self, f, client_auth=None, token_auth=None, scope=None, *args, **kwargs):
+        policy = AuthPolicy(
+            f,
+            client_auth=client_auth,
+            token_auth=token_auth,
+            scope=self._compile_scope(scope, scope_match),
+            reject=reject,
+            is_async=True
+        )
+        return self._register(
+            self._admit_async(self._compile_async(f, policy)),
+            policy
+        )
+
+    def _register(self, view, policy):
+        view.auth_policy = policy
+        self.policies.register(view, policy)
+        return view
+
+    def _compile(self, f, policy):
+        # One wrapper per combination of checks, so a request runs exactly
+        # the checks its route asked for and no flags are tested per call.
+        service = self.auth_service
+        scope = policy.scope
+        reject = policy.reject
+
+        if policy.client_auth and policy.token_auth:
+            def check(request):
+                if not service.authorize_client(request):
+                    return 'invalid_client'
+                if not service.authorize_token(request, scope):
+                    return 'invalid_token'
+                return None
+        elif policy.client_auth:
+            def check(request):
+                if not service.authorize_client(request):
+                    return 'invalid_client'
+                return None
+        elif policy.token_auth:
+            def check(request):
+                if not service.authorize_token(request, scope):
+                    return 'invalid_token'
+                return None
+        else:
+            @wraps(f)
+            def df(*args, **kwargs):
+                current_request.authorized = False
+                return f(*args, **kwargs)
+            return df
 
         @wraps(f)
         def df(*args, **kwargs):
-            request.authorized = False
+            request = current_request._get_current_object()
+            failure = check(request)
+            if failure is not None and reject:
+                if failure == 'invalid_token' and scope is not None and \
+                        service.token_lacks_scope(request):
+                    failure = 'insufficient_scope'
+                return OAuthResponse.prerendered(failure)
+            request.authorized = failure is None
+            return f(*args, **kwargs)
 
-            if client_auth:
-                authorized = self.auth_server.authorize_client(
-                    request,
-                    *args,
-                    **kwargs
-                )
+        return df
 
-            if token_auth:
-                request.authorized = self.auth_server.authorize_token(
-                    request,
-                    *args,
-                    **kwargs
+    def _compile_async(self, f, policy):
+        # Imported here so apps without coroutine views never load asyncio.
+        import asyncio
+        service = self.auth_service
+        scope = policy.scope
+        reject = policy.reject
+
+        if policy.client_auth and policy.token_auth:
+            async def check(request):
+                client_ok, token_ok = await asyncio.gather(
+                    service.authorize_client_async(request),
+                    service.authorize_token_async(request, scope)
                 )
+                if not client_ok:
+                    return 'invalid_client'
+                if not token_ok:
+                    return 'invalid_token'
+                return None
+        elif policy.client_auth:
+            async def check(request):
+                if not await service.authorize_client_async(request):
+                    return 'invalid_client'
+                return None
+        elif policy.token_auth:
+            async def check(request):
+                if not await service.authorize_token_async(request, scope):
+                    return 'invalid_token'
+                return None
+        else:
+            @wraps(f)
+            async def df(*args, **kwargs):
+                current_request.authorized = False
+                return await f(*args, **kwargs)
+            return df
 
-            return f(*args, **kwargs)
+        @wraps(f)
+        async def df(*args, **kwargs):
+            request = current_request._get_current_object()
+            failure = await check(request)
+            if failure is not None and reject:
+                if failure == 'invalid_token' and scope is not None and \
+                        service.token_lacks_scope(request):
+                    failure = 'insufficient_scope'
+                return OAuthResponse.prerendered(failure)
+            request.authorized = failure is None
+            return await f(*args, **kwargs)
+
+        return df
+
+    def _admit(self, view):
+        admission = self.admission
+        if admission is None:
+            return view
+
+        @wraps(view)
+        def df(*args, **kwargs):
+            rejected = admission.admit(current_request)
+            if rejected is not None:
+                return rejected
+            try:
+                return view(*args, **kwargs)
+            finally:
+                admission.release()
+
+        return df
+
+    def _admit_async(self, view):
+        admission = self.admission
+        if admission is None:
+            return view
+
+        @wraps(view)
+        async def df(*args, **kwargs):
+            rejected = admission.admit(current_request)
+            if rejected is not None:
+                return rejected
+            try:
+                return await view(*args, **kwargs)
+            finally:
+                admission.release()
 
         return df
 
+    def _compile_scope(self, scope, scope_match):
+        if scope is None:
+            return None
+        return self.auth_service.validator.scope_registry.compile(
+            scope,
+            scope_match
+        )
+
     def build_authorization_response(self, request):
         return self.auth_service.validate_auth_request(request)
 
     def build_revocation_response(self, request):
         return self.auth_service.validate_revoke_request(request)
 
+    def authorization_response(self, request):
+        """:meth:`build_authorization_response` as an :class:`OAuthResponse`."""
+        return OAuthResponse.from_auth_response(
+            *self.build_authorization_response(request)
+        )
+
+    def revocation_response(self, request):
+        """:meth:`build_revocation_response` as an :class:`OAuthResponse`."""
+        headers, body, status = self.build_revocation_response(request)
+        if status == 200 and not body and not headers:
+            return OAuthResponse.prerendered('revoked')
+        return OAuthResponse.from_auth_response(headers, body, status)
+
+    def build_introspection_response(self, request, tokens):
+        """RFC 7662 introspection results for a list of tokens.
+
+        Inactive tokens are reported as ``{"active": false}`` only. Active
+        ones carry ``scope``, ``client_id``, ``exp``, ``token_type`` and,
+        when the user is a string, ``username``.
+        """
+        results = []
+        for attrs in self.auth_service.introspect_tokens(request, tokens):
+            if attrs is None:
+                results.append({'active': False})
+                continue
+            result = {'active': True, 'token_type': 'Bearer'}
+            if attrs.get('scopes') is not None:
+                result['scope'] = ' '.join(split_scopes(attrs['scopes']))
+            if attrs.get('client_id') is not None:
+                result['client_id'] = attrs['client_id']
+            if attrs.get('expires_at') is not None:
+                result['exp'] = int(attrs['expires_at'])
+            if isinstance(attrs.get('user'), str):
+                result['username'] = attrs['user']
+            results.append(result)
+        return results
+
+    def build_bulk_revocation_response(self, request, client_id=None,
+                                       user=None, scope=None, batch_size=1000):
+        """Revoke tokens in bulk, streaming progress as JSON lines.
+
+        Each line reports ``revoked`` and ``total`` after a batch; the last
+        line also has ``done: true``. The response is chunked, so clients see
+        progress while a large revocation runs.
+        """
+        progress = self.auth_service.revoke_tokens(
+            request,
+            client_id=client_id,
+            user=user,
+            scope=scope,
+            batch_size=batch_size
+        )
+
+        def generate():
+            revoked = total = 0
+            for revoked, total in progress:
+                yield json.dumps({'revoked': revoked, 'total': total}) + '\n'
+            yield json.dumps(
+                {'revoked': revoked, 'total': total, 'done': True}
+            ) + '\n'
+
+        return OAuthResponse(
+            stream_with_context(generate()),
+            mimetype='application/x-ndjson'
+        )
+
 
 class FlaskForward(object):
+    """Flask extension wiring the OAuth request/response classes into an app.
+
+    The :class:`OAuthApi` and everything below it (services, validator,
+    oauthlib server) hold no per-request state, so they are built once in
+    :meth:`init_app` and shared by every thread and request of the process.
+    """
 
     auth_api_cls = OAuthApi
-    auth_api = _user_cls = _token_cls = client_cls = None
+    _user_cls = _token_cls = _client_cls = metrics = None
     ff_request_cls = OAuthRequest
     ff_response_cls = OAuthResponse
 
     def __init__(self, app=None, usr_cls=None, tk_cls=None, cl_cls=None):
         self.app = app
-        self._user_srv = usr_cls if usr_cls is not None else self._user_cls
-        self._client_srv = cl_cls if cl_cls is not None else self._client_cls
+        self._auth_api = None
+        self._user_cls = usr_cls if usr_cls is not None else self._user_cls
+        self._client_cls = cl_cls if cl_cls is not None else self._client_cls
         self._token_cls = tk_cls if tk_cls is not None else self._token_cls
+        self.policies = AuthPolicyRegistry()
 
         if app is not None:
             self.init_app(app)
 
     def init_app(self, app):
+        app.config.setdefault('FORWARD_TOKEN_CACHE_TTL', 0)
+        app.config.setdefault('FORWARD_TOKEN_CACHE_SIZE', 10000)
+        app.config.setdefault('FORWARD_SHARED_TOKEN_CACHE', None)
+        app.config.setdefault('FORWARD_SHARED_TOKEN_CACHE_SLOTS', 65536)
+        app.config.setdefault('FORWARD_SIGNED_TOKEN_KEYS', None)
+        app.config.setdefault('FORWARD_SIGNED_TOKEN_KEY_ID', None)
+        app.config.setdefault('FORWARD_SIGNED_TOKEN_CHECK_REVOKED', False)
+        app.config.setdefault('FORWARD_TOKEN_GENERATOR', None)
+        app.config.setdefault('FORWARD_CLIENT_CACHE_TTL', 0)
+        app.config.setdefault('FORWARD_CLIENT_CACHE_SIZE', 10000)
+        app.config.setdefault('FORWARD_NEGATIVE_CACHE_TTL', 0)
+        app.config.setdefault('FORWARD_NEGATIVE_CACHE_SIZE', 100000)
+        app.config.setdefault('FORWARD_WRITE_BEHIND', False)
+        app.config.setdefault('FORWARD_SINGLE_FLIGHT', False)
+        app.config.setdefault('FORWARD_SINGLE_FLIGHT_TIMEOUT', None)
+        app.config.setdefault('FORWARD_BULK_REVOKE_ENDPOINT', None)
+        app.config.setdefault('FORWARD_BULK_REVOKE_SCOPE', 'admin')
+        app.config.setdefault('FORWARD_BULK_REVOKE_BATCH_SIZE', 1000)
+        app.config.setdefault('FORWARD_INTROSPECT_ENDPOINT', None)
+        app.config.setdefault('FORWARD_INTROSPECT_SCOPE', 'introspect')
+        app.config.setdefault('FORWARD_INTROSPECT_MAX_BATCH', 100)
+        app.config.setdefault('FORWARD_RATE_LIMIT', 0)
+        app.config.setdefault('FORWARD_RATE_LIMIT_BURST', None)
+        app.config.setdefault('FORWARD_MAX_CONCURRENCY', 0)
+        app.config.setdefault('FORWARD_RETRY_AFTER', None)
+        app.config.setdefault('FORWARD_METRICS', False)
+        app.config.setdefault('FORWARD_METRICS_SAMPLE_RATE', 1.0)
+        app.config.setdefault('FORWARD_METRICS_ENDPOINT', None)
+        app.config.setdefault('FORWARD_WRITE_BEHIND_BATCH_SIZE', 100)
+        app.config.setdefault('FORWARD_WRITE_BEHIND_INTERVAL', 0.05)
+        app.config.setdefault('FORWARD_WRITE_BEHIND_QUEUE_SIZE', 10000)
+
         app.request_class = self.ff_request_cls
         app.response_class = self.ff_response_cls
 
-        if hasattr(app, 'teardown_appcontext'):
-            app.teardown_appcontext(self.teardown)
-        else:
-            app.teardown_request(self.teardown)
+        write_behind = None
+        if app.config['FORWARD_WRITE_BEHIND']:
+            write_behind = {
+                'batch_size': app.config['FORWARD_WRITE_BEHIND_BATCH_SIZE'],
+                'flush_interval': app.config['FORWARD_WRITE_BEHIND_INTERVAL'],
+                'maxsize': app.config['FORWARD_WRITE_BEHIND_QUEUE_SIZE'],
+            }
+
+        client_cache = None
+        if app.config['FORWARD_CLIENT_CACHE_TTL']:
+            client_cache = {
+                'ttl': app.config['FORWARD_CLIENT_CACHE_TTL'],
+                'maxsize': app.config['FORWARD_CLIENT_CACHE_SIZE'],
+            }
+
+        negative_cache = None
+        if app.config['FORWARD_NEGATIVE_CACHE_TTL']:
+            negative_cache = {
+                'ttl': app.config['FORWARD_NEGATIVE_CACHE_TTL'],
+                'maxsize': app.config['FORWARD_NEGATIVE_CACHE_SIZE'],
+            }
+
+        self.metrics = StageMetrics(
+            enabled=app.config['FORWARD_METRICS'],
+            sample_rate=app.config['FORWARD_METRICS_SAMPLE_RATE']
+        )
+
+        self._auth_api = self.start(
+            metrics=self.metrics,
+            policies=self.policies,
+            rate_limit=app.config['FORWARD_RATE_LIMIT'],
+            rate_limit_burst=app.config['FORWARD_RATE_LIMIT_BURST'],
+            max_concurrency=app.config['FORWARD_MAX_CONCURRENCY'],
+            retry_after=app.config['FORWARD_RETRY_AFTER'],
+            single_flight=app.config['FORWARD_SINGLE_FLIGHT'],
+            single_flight_timeout=app.config['FORWARD_SINGLE_FLIGHT_TIMEOUT'],
+            client_cache=client_cache,
+            negative_cache=negative_cache,
+            write_behind=write_behind,
+            token_cache_ttl=app.config['FORWARD_TOKEN_CACHE_TTL'],
+            token_cache_size=app.config['FORWARD_TOKEN_CACHE_SIZE'],
+            shared_token_cache=app.config['FORWARD_SHARED_TOKEN_CACHE'],
+            shared_token_cache_slots=app.config['FORWARD_SHARED_TOKEN_CACHE_SLOTS'],
+            signed_token_keys=app.config['FORWARD_SIGNED_TOKEN_KEYS'],
+            signed_token_key_id=app.config['FORWARD_SIGNED_TOKEN_KEY_ID'],
+            signed_token_check_revoked=app.config['FORWARD_SIGNED_TOKEN_CHECK_REVOKED'],
+            token_generator=app.config['FORWARD_TOKEN_GENERATOR']
+        )
+        app.extensions['flask_forward'] = self._auth_api
+
+        if app.config['FORWARD_BULK_REVOKE_ENDPOINT']:
+            app.add_url_rule(
+                app.config['FORWARD_BULK_REVOKE_ENDPOINT'],
+                'flask_forward_bulk_revoke',
+                self._auth_api.auth_required(
+                    self.bulk_revoke_view,
+                    token_auth=True,
+                    scope=app.config['FORWARD_BULK_REVOKE_SCOPE']
+                ),
+                methods=['POST']
+            )
+
+        if app.config['FORWARD_INTROSPECT_ENDPOINT']:
+            app.add_url_rule(
+                app.config['FORWARD_INTROSPECT_ENDPOINT'],
+                'flask_forward_introspect',
+                self._auth_api.auth_required(
+                    self.introspect_view,
+                    token_auth=True,
+                    scope=app.config['FORWARD_INTROSPECT_SCOPE']
+                ),
+                methods=['POST']
+            )
+
+        if app.config['FORWARD_METRICS_ENDPOINT']:
+            app.add_url_rule(
+                app.config['FORWARD_METRICS_ENDPOINT'],
+                'flask_forward_metrics',
+                self.metrics_view
+            )
 
     def teardown(self, exception):
+        # No per-request state is kept any more, so init_app no longer
+        # registers this; kept for apps that registered it themselves.
         ctx = stack.top
         if hasattr(ctx, 'flask_forward'):
             delattr(ctx, 'flask_forward')
 
-    def start(self):
+    def policy_for(self, endpoint, app=None):
+        """The :class:`AuthPolicy` protecting ``endpoint``, or None."""
+        return self.policies.for_endpoint(app or self.app or current_app, endpoint)
+
+    def bulk_revoke_view(self):
+        request = current_request._get_current_object()
+        if not request.authorized:
+            abort(403)
+
+        client_id = request._body_field('client_id')
+        user = request._body_field('user')
+        scope = request._body_field('scope')
+        if client_id is None and user is None and scope is None:
+            abort(400)
+
+        return self.auth_api.build_bulk_revocation_response(
+            request,
+            client_id=client_id,
+            user=user,
+            scope=scope,
+            batch_size=current_app.config['FORWARD_BULK_REVOKE_BATCH_SIZE']
+        )
+
+    def introspect_view(self):
+        request = current_request._get_current_object()
+        if not request.authorized:
+            abort(403)
+
+        # One token as RFC 7662's ``token`` field, or a batch as several
+        # ``token`` fields or a JSON ``tokens`` list.
+        data = request._json_data
+        if isinstance(data.get('tokens'), list):
+            tokens, batch = data['tokens'], True
+        elif data.get('token'):
+            tokens, batch = [data['token']], False
+        else:
+            tokens = request.form.getlist('token')
+            batch = len(tokens) > 1
+        if not tokens or not all(isinstance(t, str) for t in tokens):
+            abort(400)
+        if len(tokens) > current_app.config['FORWARD_INTROSPECT_MAX_BATCH']:
+            abort(413)
+
+        results = self.auth_api.build_introspection_response(request, tokens)
+        return self.ff_response_cls(
+            json.dumps({'results': results} if batch else results[0]),
+            mimetype='application/json',
+            headers={'Cache-Control': 'no-store'}
+        )
+
+    def metrics_view(self):
+        return self.ff_response_cls(
+            self.metrics.render(),
+            mimetype='text/plain; version=0.0.4'
+        )
+
+    def invalidate_client(self, client_id):
+        """Drop the cached registration, or rejection, of a client that was
+        registered or updated."""
+        if self._auth_api is not None:
+            validator = self._auth_api.auth_service.validator
+            if validator.client_registry is not None:
+                validator.client_registry.invalidate(client_id)
+            if validator.rejected_clients is not None:
+                validator.rejected_clients.discard(client_id)
+
+    def close(self):
+        """Flush any buffered token writes; call before the process exits."""
+        if self._auth_api is not None:
+            write_behind = self._auth_api.auth_service.validator.write_behind
+            if write_behind is not None:
+                write_behind.close()
+
+    def start(self, **kwargs):
         return self.auth_api_cls(
             self._user_cls,
             self._token_cls,
-            self._client_cls
+            self._client_cls,
+            **kwargs
         )
 
     @property
     def auth_api(self):
         ctx = stack.top
         if ctx is not None:
-            if not hasattr(ctx, 'flask_forward'):
-                ctx.flask_forward = self.start()
-            return ctx.flask_forward
+            return ctx.app.extensions.get('flask_forward', self._auth_api)
+        return self._auth_api
 
 #auth_api = LocalProxy(lambda: stack.top.auth_api)
 
@@ -0,0 +1,51 @@
+import inspect
+import os
+from functools import partial
+from threading import Lock, Thread
+
+_helper = None
+_helper_lock = Lock()
+
+
+def _helper_loop():
+    # One event loop per process, running in its own thread, for awaiting
+    # backends from sync code. Created on first use and again after a fork.
+    global _helper
+    import asyncio
+    with _helper_lock:
+        if _helper is None or _helper[0] != os.getpid():
+            loop = asyncio.new_event_loop()
+            Thread(
+                target=loop.run_forever,
+                name='flask-forward-async',
+                daemon=True
+            ).start()
+            _helper = (os.getpid(), loop)
+        return _helper[1]
+
+
+async def _await(awaitable):
+    return await awaitable
+
+
+def resolve(result):
+    # Async backends may be called from sync code paths such as oauthlib's
+    # grant handlers, including from inside an async view whose own loop is
+    # blocked meanwhile; run their coroutine on the helper loop.
+    if inspect.isawaitable(result):
+        import asyncio
+        return asyncio.run_coroutine_threadsafe(
+            _await(result),
+            _helper_loop()
+        ).result()
+    return result
+
+
+async def call_async(fn, *args, **kwargs):
+    # Await async backends directly and push sync ones onto the default
+    # executor so a slow store never blocks the event loop.
+    if inspect.iscoroutinefunction(fn):
+        return await fn(*args, **kwargs)
+    import asyncio
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, partial(fn, *args, **kwargs))
@@ -0,0 +1,123 @@
+import json
+import math
+import time
+from threading import BoundedSemaphore, Lock
+
+CLIENT_ID_HEADER = 'client-id'
+REMOTE_ADDR_KEY = 'remote_addr'
+
+
+class TokenBucketLimiter(object):
+    """Per-key token buckets refilling at ``rate`` per second up to ``burst``.
+
+    Buckets are spread over ``stripes`` dicts (a power of two), each with its
+    own lock, so clients rarely contend with each other. Each stripe keeps
+    at most ``maxsize / stripes`` buckets and drops the oldest when full. A
+    dropped bucket comes back full, which is what an idle client would have
+    refilled to anyway.
+    """
+
+    def __init__(self, rate, burst=None, stripes=64, maxsize=100000,
+                 clock=time.monotonic):
+        if stripes & (stripes - 1):
+            raise ValueError('stripes must be a power of two.')
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self._clock = clock
+        self._mask = stripes - 1
+        self._stripe_size = max(1, maxsize // stripes)
+        self._locks = [Lock() for _ in range(stripes)]
+        self._buckets = [{} for _ in range(stripes)]
+
+    def allow(self, key):
+        """Take one token from ``key``'s bucket; False when it is empty."""
+        i = hash(key) & self._mask
+        now = self._clock()
+        with self._locks[i]:
+            buckets = self._buckets[i]
+            bucket = buckets.get(key)
+            if bucket is None:
+                if len(buckets) >= self._stripe_size:
+                    del buckets[next(iter(buckets))]
+                bucket = buckets[key] = [self.burst, now]
+
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1.0:
+                bucket[0] = tokens
+                return False
+            bucket[0] = tokens - 1.0
+            return True
+
+
+class AdmissionControl(object):
+    """Cheap request admission ahead of any parsing or backend call.
+
+    Requests carrying a ``client-id`` header are rate limited per client
+    with a :class:`TokenBucketLimiter`. Requests without one, which may
+    still name a client in their body, are limited per ``remote_addr``
+    instead, so leaving the header out does not escape the limit. Both kinds
+    count against the global cap of ``max_concurrency`` requests in flight.
+    Rejections are answered with a 429 or 503 whose body and headers are
+    rendered once, here.
+    """
+
+    def __init__(self, rate=None, burst=None, max_concurrency=None,
+                 retry_after=None, stripes=64, maxsize=100000):
+        self.limiter = None
+        if rate:
+            self.limiter = TokenBucketLimiter(rate, burst, stripes, maxsize)
+        self.slots = None
+        if max_concurrency:
+            self.slots = BoundedSemaphore(max_concurrency)
+        self.rate_limited = self.overloaded = 0
+
+        if retry_after is None:
+            retry_after = int(math.ceil(1.0 / rate)) if rate else 1
+        self.too_many_requests = self._render(
+            429, 'rate_limited', 'Too many requests for this client.', retry_after
+        )
+        self.service_unavailable = self._render(
+            503, 'overloaded', 'Too many requests in flight.', retry_after
+        )
+
+    def _render(self, status, error, description, retry_after):
+        body = json.dumps({
+            'error': error,
+            'error_description': description,
+        }).encode('utf-8')
+        headers = (
+            ('Content-Type', 'application/json'),
+            ('Retry-After', str(retry_after)),
+            ('Cache-Control', 'no-store'),
+        )
+        return body, status, headers
+
+    def admit(self, request):
+        """None when the request may proceed, else a ``(body, status,
+        headers)`` rejection. Admitted requests must call :meth:`release`.
+        """
+        if self.limiter is not None:
+            client_id = request.headers.get(CLIENT_ID_HEADER)
+            # Address buckets are keyed apart from client ids so neither can
+            # drain the other's bucket.
+            key = client_id if client_id is not None \
+                else (REMOTE_ADDR_KEY, request.remote_addr)
+            if not self.limiter.allow(key):
+                self.rate_limited += 1
+                return self.too_many_requests
+
+        if self.slots is not None and not self.slots.acquire(False):
+            self.overloaded += 1
+            return self.service_unavailable
+        return None
+
+    def release(self):
+        if self.slots is not None:
+            self.slots.release()
+
+    def stats(self):
+        return {
+            'rate_limited': self.rate_limited,
+            'overloaded': self.overloaded,
+        }
@@ -0,0 +1,452 @@
+import os
+import time
+from collections import OrderedDict
+from hashlib import blake2b
+from threading import Lock
+
+from ._async import resolve
+from .redirects import PREFIX_MARKER, RedirectIndex
+
+
+REQUEST_ATTRS = ('user', 'client', 'scopes', 'expires_at')
+
+
+def capture_attrs(request, names=REQUEST_ATTRS, since=()):
+    """The attributes among ``names`` a backend set on an oauthlib request.
+
+    Attributes still holding the values of an earlier capture ``since``
+    were set by someone else (e.g. client authentication of the same
+    request) and are left out.
+    """
+    before = dict(since)
+    return tuple(
+        (k, v) for k, v in
+        ((k, request.__dict__[k]) for k in names if k in request.__dict__)
+        if before.get(k, _MISSING) is not v
+    )
+
+
+_MISSING = object()
+
+
+class TokenCache(object):
+    """Bounded LRU cache of successful bearer token validations.
+
+    Entries are keyed on the token and the compiled
+    :class:`~flask_forward.scopes.ScopeRequirement` it was validated for and
+    live for at most ``ttl`` seconds, or until the token's own expiry when
+    the backend reports one through ``request.expires_at`` (epoch seconds).
+    Request attributes the backend set during validation (``user``,
+    ``client``, ``scopes``) are stored alongside and restored on a hit.
+    """
+
+    def __init__(self, maxsize=10000, ttl=60, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        self._keys = {}
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, token, required, request=None):
+        key = (token, required.key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and not required.mask:
+                # Any live validation of the token satisfies no scopes.
+                key, entry = self._any_entry(token)
+            if entry is None:
+                self.misses += 1
+                return False
+            deadline, attrs = entry
+            if deadline <= self._clock():
+                self._remove(key)
+                self.misses += 1
+                return False
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        if request is not None:
+            for k, v in attrs:
+                setattr(request, k, v)
+        return True
+
+    def set(self, token, required, request=None, since=()):
+        now = self._clock()
+        deadline = now + self.ttl
+        attrs = ()
+
+        if request is not None:
+            attrs = capture_attrs(request, since=since)
+            expires_at = request.__dict__.get('expires_at')
+            if expires_at is not None:
+                deadline = min(deadline, now + expires_at - time.time())
+
+        if deadline <= now:
+            return
+
+        key = (token, required.key)
+        with self._lock:
+            self._entries[key] = (deadline, attrs)
+            self._entries.move_to_end(key)
+            self._keys.setdefault(token, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                old, _ = self._entries.popitem(last=False)
+                self._unindex(old)
+                self.evictions += 1
+
+    def invalidate(self, token):
+        with self._lock:
+            for key in self._keys.pop(token, ()):
+                self._entries.pop(key, None)
+
+    # Nothing here outlives the entries, so saving and revoking clear alike.
+    discard = invalidate
+
+    def invalidate_many(self, tokens):
+        """Invalidate a batch of tokens under a single lock acquisition."""
+        with self._lock:
+            for token in tokens:
+                for key in self._keys.pop(token, ()):
+                    self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._entries),
+        }
+
+    def _any_entry(self, token):
+        now = self._clock()
+        for key in self._keys.get(token, ()):
+            entry = self._entries[key]
+            if entry[0] > now:
+                return key, entry
+        return None, None
+
+    def _remove(self, key):
+        del self._entries[key]
+        self._unindex(key)
+
+    def _unindex(self, key):
+        keys = self._keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys[key[0]]
+
+
+class NegativeCache(object):
+    """Short-lived record of credentials a backend rejected.
+
+    Values (bearer tokens, client ids) are kept as salted 8-byte digests in
+    two generations that rotate every ``ttl / 2`` seconds, or early once
+    the current one holds ``maxsize / 2`` entries, so an entry lives less
+    than ``ttl`` seconds and the cache never exceeds ``maxsize``. Lookups
+    are exact up to a 64-bit digest collision: unlike a Bloom filter, a
+    value that was never rejected is not reported as one.
+
+    A rejection may be recorded for a ``key`` (e.g. the scope requirement a
+    token failed); ``None`` marks a value rejected whatever is asked of it.
+    :meth:`discard` forgets a value, and rejections recorded with a
+    :meth:`stamp` taken before it are ignored, so a backend answer that
+    raced with it cannot bring the value back.
+    """
+
+    STRIPES = 64
+
+    def __init__(self, ttl=5, maxsize=100000, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._clock = clock
+        self._salt = os.urandom(16)
+        self._lock = Lock()
+        self._current = {}
+        self._previous = {}
+        self._rotated = clock()
+        self._epochs = [0] * self.STRIPES
+        self.hits = self.misses = 0
+
+    def _digest(self, value):
+        return int.from_bytes(blake2b(
+            value.encode('utf-8'), digest_size=8, key=self._salt
+        ).digest(), 'little')
+
+    def _rotate(self, now):
+        # Caller holds the lock. Generations start a half period apart so
+        # the previous one is dropped before its oldest entry reaches ttl.
+        period = self.ttl / 2.0
+        elapsed = now - self._rotated
+        if elapsed >= 2 * period:
+            self._previous = {}
+            self._rotated = now
+        elif elapsed >= period:
+            self._previous = self._current
+            self._rotated += period
+        else:
+            return
+        self._current = {}
+
+    def rejects(self, value, key=None):
+        """True when ``value`` was rejected for ``key`` or outright."""
+        now = self._clock()
+        if now - self._rotated >= self.ttl / 2.0:
+            with self._lock:
+                self._rotate(now)
+
+        digest = self._digest(value)
+        for generation in (self._current, self._previous):
+            keys = generation.get(digest)
+            if keys is not None and (None in keys or key in keys):
+                self.hits += 1
+                return True
+        self.misses += 1
+        return False
+
+    def marked(self, value, key):
+        """True when ``value`` was added with exactly ``key``."""
+        digest = self._digest(value)
+        return any(
+            key in generation.get(digest, ())
+            for generation in (self._current, self._previous)
+        )
+
+    def stamp(self, value):
+        """Token to pass to :meth:`add` for a backend call made after this."""
+        return self._epochs[hash(value) % self.STRIPES]
+
+    def add(self, value, key=None, stamp=None):
+        digest = self._digest(value)
+        stripe = hash(value) % self.STRIPES
+        with self._lock:
+            if stamp is not None and self._epochs[stripe] != stamp:
+                return
+            self._rotate(self._clock())
+            current = self._current
+            if len(current) >= self.maxsize // 2 and digest not in current:
+                self._previous = current
+                self._current = current = {}
+                self._rotated = self._clock()
+            keys = current.get(digest, ())
+            if key not in keys:
+                current[digest] = keys + (key,)
+
+    def discard(self, value):
+        digest = self._digest(value)
+        with self._lock:
+            self._epochs[hash(value) % self.STRIPES] += 1
+            self._current.pop(digest, None)
+            self._previous.pop(digest, None)
+
+    def clear(self):
+        with self._lock:
+            self._epochs = [e + 1 for e in self._epochs]
+            self._current = {}
+            self._previous = {}
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._current) + len(self._previous),
+        }
+
+
+class ClientRecord(object):
+    """A client registration normalised for fast lookups.
+
+    Built from the mapping returned by the client backend's ``get_client``,
+    which may contain ``redirect_uris`` (or a single ``redirect_uri``),
+    ``default_redirect_uri``, ``scopes`` (the defaults), ``allowed_scopes``
+    (defaults to ``scopes``), ``response_types`` (defaults to ``token``) and
+    ``active``. The original mapping is kept as ``data``.
+    """
+
+    __slots__ = ('client_id', 'data', 'active', 'redirect_uris',
+                 'default_redirect_uri', 'scopes', 'allowed_scopes',
+                 'response_types')
+
+    def __init__(self, client_id, data):
+        self.client_id = client_id
+        self.data = data
+        self.active = data.get('active', True)
+
+        uris = data.get('redirect_uris')
+        if uris is None:
+            uris = [data['redirect_uri']] if data.get('redirect_uri') else []
+        self.redirect_uris = tuple(uris)
+        self.default_redirect_uri = data.get('default_redirect_uri') or next(
+            (uri for uri in uris if not uri.endswith(PREFIX_MARKER)),
+            None
+        )
+
+        self.scopes = list(data.get('scopes') or ())
+        self.allowed_scopes = frozenset(data.get('allowed_scopes') or self.scopes)
+        self.response_types = frozenset(data.get('response_types') or ('token',))
+
+
+class ClientRegistry(object):
+    """TTL/LRU cache of full client registrations.
+
+    Each client is fetched once per ``ttl`` through ``backend.get_client``
+    and every client check of an authorization request is answered from the
+    cached :class:`ClientRecord`. Unknown clients are not cached. Call
+    :meth:`invalidate` whenever a client's registration changes.
+
+    Redirect URIs of cached clients are kept in a :class:`RedirectIndex`,
+    updated incrementally each time a registration is (re)loaded. Concurrent
+    fetches of the same client are coalesced when a :class:`SingleFlight`
+    is given.
+    """
+
+    def __init__(self, backend, maxsize=10000, ttl=60, clock=time.monotonic,
+                 single_flight=None):
+        self.backend = backend
+        self.single_flight = single_flight
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        self.redirects = RedirectIndex()
+        self.hits = self.misses = self.evictions = 0
+
+    def peek(self, client_id):
+        """The cached record for ``client_id``, without fetching it."""
+        with self._lock:
+            entry = self._entries.get(client_id)
+            if entry is not None and entry[0] > self._clock():
+                self._entries.move_to_end(client_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        return None
+
+    def get(self, client_id, request=None):
+        record = self.peek(client_id)
+        if record is not None:
+            return record
+
+        if self.single_flight is not None:
+            data = self.single_flight.do(
+                ('get_client', client_id),
+                self._fetch,
+                client_id,
+                request
+            )
+        else:
+            data = self._fetch(client_id, request)
+        if data is None:
+            return None
+        return self.set(client_id, data)
+
+    def _fetch(self, client_id, request):
+        return resolve(self.backend.get_client(client_id, request))
+
+    def set(self, client_id, data):
+        record = ClientRecord(client_id, data)
+        self.redirects.update(client_id, record.redirect_uris)
+        with self._lock:
+            self._entries[client_id] = (self._clock() + self.ttl, record)
+            self._entries.move_to_end(client_id)
+            while len(self._entries) > self.maxsize:
+                evicted, _ = self._entries.popitem(last=False)
+                self.redirects.remove(evicted)
+                self.evictions += 1
+        return record
+
+    def match_redirect_uri(self, client_id, redirect_uri, request=None):
+        if self.get(client_id, request) is None:
+            return False
+        return self.redirects.match(client_id, redirect_uri)
+
+    def invalidate(self, client_id):
+        with self._lock:
+            self._entries.pop(client_id, None)
+        self.redirects.remove(client_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self.redirects = RedirectIndex()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._entries),
+        }
+
+
+class SingleFlight(object):
+    """Coalesce concurrent calls that share a key into a single call.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait for and share its result, or its exception. Waiters
+    give up with ``TimeoutError`` after ``timeout`` seconds. Threads and
+    coroutines (from any event loop) can wait on the same call, since the
+    result is published through a :class:`concurrent.futures.Future`.
+    """
+
+    def __init__(self, timeout=None):
+        # Imported here so apps without single-flight never load
+        # concurrent.futures.
+        from concurrent.futures import Future
+        self.timeout = timeout
+        self._future = Future
+        self._lock = Lock()
+        self._calls = {}
+        self.calls = self.shared = 0
+
+    def _join(self, key):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.shared += 1
+                return future, False
+            future = self._calls[key] = self._future()
+            self.calls += 1
+            return future, True
+
+    def _leave(self, key):
+        with self._lock:
+            del self._calls[key]
+
+    def do(self, key, fn, *args, **kwargs):
+        future, leader = self._join(key)
+        if leader:
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                self._leave(key)
+        return future.result(self.timeout)
+
+    async def do_async(self, key, fn, *args, **kwargs):
+        future, leader = self._join(key)
+        if leader:
+            try:
+                future.set_result(await fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                self._leave(key)
+            return future.result()
+
+        import asyncio
+
+        # shield() keeps one waiter's timeout from cancelling the shared call.
+        return await asyncio.wait_for(
+            asyncio.shield(asyncio.wrap_future(future)),
+            self.timeout
+        )
@@ -0,0 +1,132 @@
+import random
+import time
+from bisect import bisect_left
+from threading import Lock
+
+from flask.signals import Namespace
+
+_signals = Namespace()
+
+#: Sent for every sampled stage timing with ``stage`` (name) and
+#: ``duration`` (seconds) keyword arguments; the sender is the
+#: :class:`StageMetrics` instance.
+stage_timed = _signals.signal('flask-forward-stage-timed')
+
+STAGES = (
+    'parse',
+    'to_auth_req',
+    'client_auth',
+    'token_validation',
+    'authorization',
+    'token_save',
+    'revocation',
+    'introspection',
+)
+
+#: Histogram bucket upper bounds in seconds, 10us to 10s.
+BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class Histogram(object):
+    """Fixed-bucket latency histogram.
+
+    ``calls`` counts every call of the stage, ``count`` only the sampled
+    ones that were timed.
+    """
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count', 'calls', '_lock')
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = self.calls = 0
+        self._lock = Lock()
+
+    def hit(self):
+        with self._lock:
+            self.calls += 1
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+            self.calls += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+            total += n
+            yield bound, total
+
+
+class StageMetrics(object):
+    """Per-stage call counts and sampled latency histograms.
+
+    Hot paths call :meth:`start` before a stage and :meth:`lap` after it.
+    When metrics are disabled both are no-ops. Calls that are not sampled
+    are counted but not timed, so the instrumentation can stay on in
+    production at a low ``sample_rate``.
+    """
+
+    def __init__(self, enabled=False, sample_rate=1.0, stages=STAGES):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.histograms = dict((stage, Histogram()) for stage in stages)
+
+    def start(self):
+        if not self.enabled:
+            return None
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        return time.perf_counter()
+
+    def lap(self, stage, started):
+        """Record ``stage`` as finished; returns a start for the next stage."""
+        if started is None:
+            return None
+        if started is False:
+            self.histograms[stage].hit()
+            return False
+
+        now = time.perf_counter()
+        duration = now - started
+        self.histograms[stage].observe(duration)
+        if stage_timed.receivers:
+            stage_timed.send(self, stage=stage, duration=duration)
+        return now
+
+    def render(self):
+        """Prometheus text exposition of every stage."""
+        lines = [
+            '# HELP flask_forward_stage_calls_total Calls per auth stage.',
+            '# TYPE flask_forward_stage_calls_total counter',
+        ]
+        for stage, histogram in self.histograms.items():
+            lines.append(
+                'flask_forward_stage_calls_total{stage="%s"} %d'
+                % (stage, histogram.calls)
+            )
+
+        lines += [
+            '# HELP flask_forward_stage_seconds Sampled auth stage latency.',
+            '# TYPE flask_forward_stage_seconds histogram',
+        ]
+        for stage, histogram in self.histograms.items():
+            for bound, total in histogram.cumulative():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(
+                    'flask_forward_stage_seconds_bucket{stage="%s",le="%s"} %d'
+                    % (stage, le, total)
+                )
+            lines.append('flask_forward_stage_seconds_sum{stage="%s"} %r'
+                         % (stage, histogram.sum))
+            lines.append('flask_forward_stage_seconds_count{stage="%s"} %d'
+                         % (stage, histogram.count))
+        return '\n'.join(lines) + '\n'
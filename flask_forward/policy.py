@@ -0,0 +1,77 @@
+from threading import Lock
+
+
+class AuthPolicy(object):
+    """The auth checks ``auth_required`` compiled for one view."""
+
+    __slots__ = ('view', 'client_auth', 'token_auth', 'scope', 'reject',
+                 'is_async')
+
+    def __init__(self, view, client_auth=False, token_auth=False, scope=None,
+                 reject=False, is_async=False):
+        self.view = view
+        self.client_auth = bool(client_auth)
+        self.token_auth = bool(token_auth)
+        self.scope = scope
+        self.reject = bool(reject)
+        self.is_async = is_async
+
+    @property
+    def name(self):
+        return '%s.%s' % (self.view.__module__, self.view.__qualname__)
+
+    @property
+    def protected(self):
+        return self.client_auth or self.token_auth
+
+    def __repr__(self):
+        checks = [c for c, on in (('client', self.client_auth),
+                                  ('token', self.token_auth)) if on]
+        return '<AuthPolicy %s: %s%s>' % (
+            self.name,
+            '+'.join(checks) or 'none',
+            ' %r' % self.scope if self.scope is not None else ''
+        )
+
+
+class AuthPolicyRegistry(object):
+    """Policies of every view wrapped by ``auth_required``.
+
+    Views are registered as they are decorated, keyed by the wrapper
+    ``auth_required`` returned. :meth:`for_endpoint` finds the policy of a
+    Flask endpoint even when further decorators wrap it (through their
+    ``__wrapped__`` attribute); endpoints without one are unprotected.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._policies = {}
+
+    def __len__(self):
+        return len(self._policies)
+
+    def __iter__(self):
+        return iter(list(self._policies.values()))
+
+    def register(self, wrapper, policy):
+        with self._lock:
+            self._policies[wrapper] = policy
+
+    def get(self, view):
+        """The policy of ``view`` or of a function it wraps, or None."""
+        while view is not None:
+            policy = self._policies.get(view)
+            if policy is not None:
+                return policy
+            view = getattr(view, '__wrapped__', None)
+        return None
+
+    def for_endpoint(self, app, endpoint):
+        return self.get(app.view_functions.get(endpoint))
+
+    def endpoints(self, app):
+        """Mapping of each of ``app``'s endpoints to its policy or None."""
+        return dict(
+            (endpoint, self.get(view))
+            for endpoint, view in app.view_functions.items()
+        )
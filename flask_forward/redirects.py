@@ -0,0 +1,146 @@
+from threading import Lock
+from urllib.parse import unquote, urlsplit
+
+PREFIX_MARKER = '*'
+
+_TERMINAL = None
+
+
+def _split(uri):
+    parts = urlsplit(uri)
+    origin = (parts.scheme.lower(), parts.netloc.lower())
+    segments = [s for s in parts.path.split('/') if s]
+    return origin, parts, segments
+
+
+def _normalise(origin, parts):
+    uri = '%s://%s%s' % (origin[0], origin[1], parts.path or '/')
+    if parts.query:
+        uri += '?' + parts.query
+    return uri
+
+
+def _traverses(parts):
+    # Browsers resolve '.' and '..' segments, percent-encoded or not and
+    # with backslashes read as slashes, before following a redirect, so a
+    # URI that still carries them could climb out of a registered prefix.
+    path = unquote(parts.path).replace('\\', '/')
+    return any(s in ('.', '..') for s in path.split('/'))
+
+
+class _Origin(object):
+    """Registered URIs sharing a scheme and host."""
+
+    __slots__ = ('exact', 'prefixes')
+
+    def __init__(self):
+        self.exact = set()
+        self.prefixes = {}
+
+    def __bool__(self):
+        return bool(self.exact or self.prefixes)
+
+    def add_prefix(self, segments):
+        node = self.prefixes
+        for segment in segments:
+            node = node.setdefault(segment, {})
+        node[_TERMINAL] = True
+
+    def remove_prefix(self, segments):
+        path = [self.prefixes]
+        for segment in segments:
+            node = path[-1].get(segment)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].pop(_TERMINAL, None)
+
+        # Prune branches left without any registration below them.
+        for i in range(len(segments), 0, -1):
+            if path[i]:
+                break
+            del path[i - 1][segments[i - 1]]
+
+    def match_prefix(self, segments):
+        node = self.prefixes
+        if _TERMINAL in node:
+            return True
+        for segment in segments:
+            node = node.get(segment)
+            if node is None:
+                return False
+            if _TERMINAL in node:
+                return True
+        return False
+
+
+class RedirectIndex(object):
+    """Index of the redirect URIs registered by each client.
+
+    URIs are grouped by client, then by scheme and host. Exact
+    registrations are matched with one set lookup; registrations ending in
+    ``*`` match any URI whose path starts with the same segments and are
+    kept in a per-host segment trie, so a lookup costs one step per path
+    segment regardless of how many URIs a client registered.
+    :meth:`update` applies only the difference between a client's old and
+    new registrations. Redirect URIs containing ``.`` or ``..`` path
+    segments, percent-encoded or not, never match.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._clients = {}
+
+    def __contains__(self, client_id):
+        return client_id in self._clients
+
+    def update(self, client_id, uris):
+        uris = frozenset(uris)
+        with self._lock:
+            registered, origins = self._clients.get(client_id, (frozenset(), {}))
+            for uri in registered - uris:
+                self._remove(origins, uri)
+            for uri in uris - registered:
+                self._add(origins, uri)
+            self._clients[client_id] = (uris, origins)
+
+    def remove(self, client_id):
+        with self._lock:
+            self._clients.pop(client_id, None)
+
+    def match(self, client_id, redirect_uri):
+        entry = self._clients.get(client_id)
+        if entry is None or not redirect_uri:
+            return False
+
+        origin, parts, segments = _split(redirect_uri)
+        registered = entry[1].get(origin)
+        if registered is None:
+            return False
+        if parts.fragment or _traverses(parts):
+            return False
+        if _normalise(origin, parts) in registered.exact:
+            return True
+        return registered.match_prefix(segments)
+
+    def _add(self, origins, uri):
+        prefix = uri.endswith(PREFIX_MARKER)
+        origin, parts, segments = _split(uri.rstrip(PREFIX_MARKER))
+        registered = origins.setdefault(origin, _Origin())
+        if prefix:
+            registered.add_prefix(segments)
+        else:
+            registered.exact.add(_normalise(origin, parts))
+
+    def _remove(self, origins, uri):
+        prefix = uri.endswith(PREFIX_MARKER)
+        origin, parts, segments = _split(uri.rstrip(PREFIX_MARKER))
+        registered = origins.get(origin)
+        if registered is None:
+            return
+        if prefix:
+            registered.remove_prefix(segments)
+        else:
+            registered.exact.discard(_normalise(origin, parts))
+        if not registered:
+            del origins[origin]
@@ -0,0 +1,114 @@
+from threading import Lock
+
+ALL = 'all'
+ANY = 'any'
+
+
+def split_scopes(scopes):
+    """Accept OAuth's space separated scope strings as well as sequences."""
+    if not scopes:
+        return ()
+    if isinstance(scopes, str):
+        return tuple(scopes.split())
+    return tuple(scopes)
+
+
+class ScopeRequirement(object):
+    """A compiled scope check: a bit mask plus an all-of/any-of rule.
+
+    ``scopes`` keeps the original names for backends that expect the list
+    form, and ``key`` is a hashable identity usable as a cache key.
+    """
+
+    __slots__ = ('mask', 'match', 'scopes', 'key')
+
+    def __init__(self, mask, match, scopes):
+        if match not in (ALL, ANY):
+            raise ValueError('Scope match must be %r or %r.' % (ALL, ANY))
+        self.mask = mask
+        self.match = match
+        self.scopes = list(scopes)
+        self.key = (mask, match)
+
+    def allows(self, granted):
+        """Check a granted scope bitset against the requirement."""
+        if self.match == ALL:
+            return granted & self.mask == self.mask
+        return not self.mask or granted & self.mask != 0
+
+    def __repr__(self):
+        return '<ScopeRequirement %s of %r>' % (self.match, self.scopes)
+
+
+class ScopeRegistry(object):
+    """Interns scope names to bit positions.
+
+    Only scopes that some route requires need a bit; scopes a token carries
+    that nothing asks for are ignored when its bitset is computed, so the
+    registry stays as small as the set of protected scopes.
+    """
+
+    def __init__(self, scopes=()):
+        self._lock = Lock()
+        self._bits = {}
+        for scope in scopes:
+            self.bit(scope)
+
+    def __contains__(self, scope):
+        return scope in self._bits
+
+    def __len__(self):
+        return len(self._bits)
+
+    def bit(self, scope):
+        bit = self._bits.get(scope)
+        if bit is None:
+            with self._lock:
+                bit = self._bits.get(scope)
+                if bit is None:
+                    bit = self._bits[scope] = 1 << len(self._bits)
+        return bit
+
+    def mask(self, scopes):
+        """Bitset of the known scopes among ``scopes``."""
+        bits = self._bits
+        mask = 0
+        for scope in split_scopes(scopes):
+            mask |= bits.get(scope, 0)
+        return mask
+
+    def names(self, mask):
+        return [scope for scope, bit in self._bits.items() if mask & bit]
+
+    def compile(self, scopes, match=ALL):
+        """Compile required scopes once, interning any new names.
+
+        Meant for scopes fixed in code (route decorators); scopes that
+        arrive with a request go through :meth:`lookup`.
+        """
+        if isinstance(scopes, ScopeRequirement):
+            return scopes
+        names = split_scopes(scopes)
+        mask = 0
+        for scope in names:
+            mask |= self.bit(scope)
+        return ScopeRequirement(mask, match, names)
+
+    def lookup(self, scopes, match=ALL):
+        """Like :meth:`compile`, but never interns new names.
+
+        A scope no route requires has no bit and cannot be checked, so it
+        is treated as unmet: None is returned when an all-of requirement
+        names one, or when none of an any-of requirement's are known.
+        """
+        if isinstance(scopes, ScopeRequirement):
+            return scopes
+        names = split_scopes(scopes)
+        bits = self._bits
+        known = [scope for scope in names if scope in bits]
+        if len(known) < len(names) and (match == ALL or not known):
+            return None
+        mask = 0
+        for scope in known:
+            mask |= bits[scope]
+        return ScopeRequirement(mask, match, known)
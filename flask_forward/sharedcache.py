@@ -0,0 +1,345 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import time
+from threading import Lock
+
+from .scopes import ALL, split_scopes
+
+MAGIC = b'FFWDSHC1'
+
+# Header: magic, slot count, scope count, digest salt, then the scope table.
+_HEADER = struct.Struct('<8sII16s')
+_SCOPE = struct.Struct('<8s')
+MAX_SCOPES = 64
+_SCOPES_OFFSET = _HEADER.size
+_SLOTS_OFFSET = _SCOPES_OFFSET + MAX_SCOPES * _SCOPE.size
+
+# Slot: sequence, state, token digest, deadline, granted scope bits, client id.
+_SLOT = struct.Struct('<II16sdQB47s')
+_SEQ = struct.Struct('<I')
+# Reads of a slot that keeps changing (or whose writer died mid-update)
+# give up after this many tries and count as a miss.
+READ_RETRIES = 64
+
+EMPTY = 0
+VALID = 1
+REVOKED = 2
+
+
+class SharedTokenCache(object):
+    """Bearer token validation cache shared by the processes of one host.
+
+    The cache is a fixed-size open-addressing hash table in a memory-mapped
+    file (put it on ``/dev/shm``), so every worker of a pre-fork server sees
+    the same entries. Slots hold a salted digest of the token, the deadline
+    and a bitset of the scopes the token was validated for; bit positions
+    come from a scope table in the file header so they agree across
+    processes. Readers take no lock: each slot carries a sequence number
+    that writers make odd while they update it, and readers retry when it
+    was odd or changed under them, up to ``READ_RETRIES`` times before
+    counting a miss. Writers serialise on ``flock`` (plus a thread lock).
+
+    A hit restores only the scopes this process knows of and no
+    ``expires_at``, so token introspection does not answer from it. The
+    table has room for 64 scopes; only those compiled into
+    ``scope_registry`` (by route decorators) are added to it, so scopes
+    named by clients cannot fill it.
+
+    Invalidating a token leaves a tombstone for ``ttl`` seconds, so a worker
+    that validated the token just before it was revoked elsewhere cannot
+    cache it again. Only ``client_id`` and the ``scopes`` this process knows
+    of are restored on a hit; ``user`` and ``client`` objects are not shared.
+    """
+
+    def __init__(self, path, slots=65536, ttl=60, max_probe=8,
+                 scope_registry=None, clock=time.time):
+        if slots & (slots - 1):
+            raise ValueError('slots must be a power of two.')
+        self.path = path
+        self.scope_registry = scope_registry
+        self.ttl = ttl
+        self.max_probe = min(max_probe, slots)
+        self._clock = clock
+        self._mask = slots - 1
+        self._thread_lock = Lock()
+        self._bits = {}
+        self.hits = self.misses = self.evictions = 0
+
+        size = _SLOTS_OFFSET + slots * _SLOT.size
+        self._open()
+        with self._locked():
+            if os.fstat(self._fd).st_size == 0:
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd, _HEADER.pack(MAGIC, slots, 0, os.urandom(16)), 0)
+            elif os.fstat(self._fd).st_size != size:
+                raise ValueError('%s holds a cache of a different size.' % path)
+        self._map = mmap.mmap(self._fd, size)
+
+        magic, self.slots, _, self._salt = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or self.slots != slots:
+            raise ValueError('%s is not a shared token cache.' % path)
+
+    def _open(self):
+        # flock belongs to the open file description, which a forked child
+        # shares with its parent, so every process locks through its own.
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._pid = os.getpid()
+
+    def _locked(self):
+        if self._pid != os.getpid():
+            self._open()
+        return _FileLock(self._fd, self._thread_lock)
+
+    def _digest(self, token):
+        if isinstance(token, str):
+            token = token.encode('utf-8')
+        return hashlib.blake2b(token, digest_size=16, key=self._salt).digest()
+
+    def _bit(self, scope, create=False):
+        bit = self._bits.get(scope)
+        if bit is not None:
+            return bit
+
+        digest = hashlib.blake2b(scope.encode('utf-8'), digest_size=8).digest()
+        bit = self._find_scope(digest)
+        if bit is None and create:
+            with self._locked():
+                bit = self._find_scope(digest)
+                if bit is None:
+                    count = _HEADER.unpack_from(self._map, 0)[2]
+                    if count >= MAX_SCOPES:
+                        return None
+                    _SCOPE.pack_into(self._map, _SCOPES_OFFSET + count * _SCOPE.size, digest)
+                    struct.pack_into('<I', self._map, 12, count + 1)
+                    bit = 1 << count
+        if bit is not None:
+            self._bits[scope] = bit
+        return bit
+
+    def _find_scope(self, digest):
+        count = _HEADER.unpack_from(self._map, 0)[2]
+        for i in range(count):
+            if _SCOPE.unpack_from(self._map, _SCOPES_OFFSET + i * _SCOPE.size)[0] == digest:
+                return 1 << i
+        return None
+
+    def _read(self, offset):
+        # Seqlock read: copy the slot, then check its sequence was even and
+        # did not change meanwhile. None when no consistent copy was had.
+        for _ in range(READ_RETRIES):
+            seq = _SEQ.unpack_from(self._map, offset)[0]
+            if seq & 1:
+                continue
+            slot = _SLOT.unpack_from(self._map, offset)
+            if _SEQ.unpack_from(self._map, offset)[0] == seq:
+                return slot
+        return None
+
+    def _read_locked(self, offset):
+        # Writers hold the lock, so the slot cannot change under them. A
+        # slot left odd by a writer that died mid-update may be torn; it
+        # reads as empty so it is reused.
+        slot = _SLOT.unpack_from(self._map, offset)
+        if slot[0] & 1:
+            return (slot[0], EMPTY, b'', 0.0, 0, 0, b'')
+        return slot
+
+    def _write(self, offset, state, digest, deadline, granted, client_id):
+        # Odd while the slot is being written and even once it is
+        # consistent, whatever sequence an interrupted writer left behind.
+        seq = _SEQ.unpack_from(self._map, offset)[0] | 1
+        _SEQ.pack_into(self._map, offset, seq)
+        _SLOT.pack_into(self._map, offset, seq, state, digest, deadline,
+                        granted, len(client_id), client_id)
+        _SEQ.pack_into(self._map, offset, (seq + 1) & 0xFFFFFFFF)
+
+    def _probe(self, digest):
+        start = int.from_bytes(digest[:8], 'little')
+        for i in range(self.max_probe):
+            yield _SLOTS_OFFSET + ((start + i) & self._mask) * _SLOT.size
+
+    def _lookup(self, digest):
+        for offset in self._probe(digest):
+            slot = self._read(offset)
+            if slot is None or slot[1] == EMPTY:
+                return None
+            if slot[2] == digest:
+                return slot
+        return None
+
+    def get(self, token, required, request=None):
+        digest = self._digest(token)
+        slot = self._lookup(digest)
+        if slot is None or slot[1] != VALID or slot[3] <= self._clock():
+            self.misses += 1
+            return False
+
+        granted = slot[4]
+        need = 0
+        for scope in required.scopes:
+            bit = self._bit(scope)
+            if bit is None:
+                if required.match == ALL:
+                    self.misses += 1
+                    return False
+                continue
+            need |= bit
+        if required.match == ALL:
+            allowed = granted & need == need
+        else:
+            allowed = not required.scopes or granted & need != 0
+        if not allowed:
+            self.misses += 1
+            return False
+
+        self.hits += 1
+        if request is not None:
+            request.scopes = [s for s, b in self._bits.items() if granted & b]
+            if slot[5]:
+                request.client_id = slot[6][:slot[5]].decode('utf-8')
+        return True
+
+    def set(self, token, required, request=None, since=()):
+        now = self._clock()
+        deadline = now + self.ttl
+        scopes = None
+        client_id = b''
+
+        if request is not None:
+            expires_at = request.__dict__.get('expires_at')
+            if expires_at is not None:
+                deadline = min(deadline, expires_at)
+            scopes = request.__dict__.get('scopes')
+            cid = request.__dict__.get('client_id')
+            if cid:
+                client_id = cid.encode('utf-8')
+                if len(client_id) > 47:
+                    client_id = b''
+        if deadline <= now:
+            return
+
+        # Only scopes some route requires get a bit in the shared table.
+        registry = self.scope_registry
+        for scope in required.scopes:
+            if registry is None or scope in registry:
+                self._bit(scope, create=True)
+        if scopes is None:
+            # An any-of match does not tell which of the scopes were granted.
+            if required.match != ALL:
+                return
+            scopes = required.scopes
+
+        granted = 0
+        for scope in split_scopes(scopes):
+            bit = self._bit(scope)
+            if bit is not None:
+                granted |= bit
+
+        digest = self._digest(token)
+        with self._locked():
+            target = victim = None
+            for offset in self._probe(digest):
+                slot = self._read_locked(offset)
+                if slot[2] == digest and slot[1] != EMPTY:
+                    if slot[1] == REVOKED and slot[3] > now:
+                        return
+                    if slot[1] == VALID and slot[3] > now:
+                        granted |= slot[4]
+                    target = offset
+                    break
+                if target is None and (slot[1] == EMPTY or slot[3] <= now):
+                    target = offset
+                if slot[1] == EMPTY:
+                    break
+                if victim is None or slot[3] < victim[1]:
+                    victim = (offset, slot[3])
+
+            if target is None:
+                target = victim[0]
+                self.evictions += 1
+            self._write(target, VALID, digest, deadline, granted, client_id)
+
+    def discard(self, token):
+        """Expire a cached validation of ``token`` without tombstoning it.
+
+        Used when a token is saved again: unlike a revocation, the new copy
+        may be cached straight away.
+        """
+        digest = self._digest(token)
+        slot = self._lookup(digest)
+        if slot is not None and slot[1] != VALID:
+            return
+        now = self._clock()
+        with self._locked():
+            for offset in self._probe(digest):
+                slot = self._read_locked(offset)
+                if slot[1] == EMPTY:
+                    return
+                if slot[2] == digest:
+                    if slot[1] == VALID and slot[3] > now:
+                        # Left expired rather than emptied so that slots
+                        # probed past this one stay reachable.
+                        self._write(offset, VALID, digest, now, 0, b'')
+                    return
+
+    def invalidate(self, token):
+        self.invalidate_many((token,))
+
+    def invalidate_many(self, tokens):
+        """Tombstone a batch of tokens under a single lock acquisition."""
+        now = self._clock()
+        digests = [self._digest(token) for token in tokens]
+        with self._locked():
+            for digest in digests:
+                target = None
+                for offset in self._probe(digest):
+                    slot = self._read_locked(offset)
+                    if slot[2] == digest and slot[1] != EMPTY:
+                        target = offset
+                        break
+                    if target is None and (slot[1] == EMPTY or slot[3] <= now):
+                        target = offset
+                    if slot[1] == EMPTY:
+                        break
+                if target is not None:
+                    self._write(target, REVOKED, digest, now + self.ttl, 0, b'')
+
+    def clear(self):
+        with self._locked():
+            self._map[_SLOTS_OFFSET:] = bytes(len(self._map) - _SLOTS_OFFSET)
+
+    def stats(self):
+        now = self._clock()
+        size = 0
+        for i in range(self.slots):
+            slot = self._read(_SLOTS_OFFSET + i * _SLOT.size)
+            if slot is not None and slot[1] == VALID and slot[3] > now:
+                size += 1
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': size,
+        }
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+class _FileLock(object):
+
+    def __init__(self, fd, thread_lock):
+        self._fd = fd
+        self._thread_lock = thread_lock
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
@@ -0,0 +1,33 @@
+"""Reference implementations of the ``token`` and ``client`` backends.
+
+Each name is imported from its module on first access, so using the memory
+stores never loads ``sqlite3`` and a store without a journal never loads
+``mmap``.
+"""
+import importlib
+
+_EXPORTS = {
+    'Journal': '.journal',
+    'MemoryClientService': '.memory',
+    'MemoryTokenService': '.memory',
+    'MemoryTokenStore': '.memory',
+    'SQLiteClientService': '.sqlite',
+    'SQLiteDatabase': '.sqlite',
+    'SQLiteTokenService': '.sqlite',
+    'TimingWheel': '.memory',
+}
+
+__all__ = tuple(sorted(_EXPORTS))
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,317 @@
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+import weakref
+import zlib
+
+log = logging.getLogger(__name__)
+
+PUT = 1
+DELETE = 2
+
+MAGIC = b'FFWDSNP1'
+
+# Snapshot header: magic, sequence of the first log it does not cover,
+# number of entries.
+HEADER = struct.Struct('<8sQQ')
+# Every entry, in logs and snapshots alike: payload length and CRC-32.
+FRAME = struct.Struct('<II')
+# Payload: op, a number (e.g. an expiry) and the byte lengths of five
+# UTF-8 fields, -1 for None, followed by the fields themselves.
+RECORD = struct.Struct('<Bd5i')
+FIELDS = 5
+
+
+def encode(op, number=0.0, fields=()):
+    """One framed entry of ``op``, ``number`` and up to five str fields."""
+    fields = tuple(fields) + (None,) * (FIELDS - len(fields))
+    data = [None if f is None else f.encode('utf-8') for f in fields]
+    payload = RECORD.pack(
+        op, number, *[-1 if d is None else len(d) for d in data]
+    ) + b''.join(d for d in data if d)
+    return FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode(buf, offset):
+    """The entry framed at ``offset`` and the offset after it.
+
+    Returns None at the end of ``buf`` or at a torn or corrupt entry.
+    """
+    end = offset + FRAME.size
+    if end > len(buf):
+        return None
+    length, crc = FRAME.unpack_from(buf, offset)
+    if length < RECORD.size or end + length > len(buf):
+        return None
+    payload = buf[end:end + length]
+    if zlib.crc32(payload) != crc:
+        return None
+
+    unpacked = RECORD.unpack_from(payload)
+    pos = RECORD.size
+    fields = []
+    for size in unpacked[2:]:
+        if size < 0:
+            fields.append(None)
+        else:
+            fields.append(payload[pos:pos + size].decode('utf-8'))
+            pos += size
+    return (unpacked[0], unpacked[1], fields), end + length
+
+
+def _read(path, apply, offset=0):
+    # Apply every intact entry of ``path`` from ``offset``; returns the count
+    # and the offset where reading stopped.
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size <= offset:
+            return 0, offset
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            count = 0
+            while True:
+                entry = decode(buf, offset)
+                if entry is None:
+                    return count, offset
+                (op, number, fields), offset = entry
+                apply(op, number, fields)
+                count += 1
+
+
+_journals = weakref.WeakSet()
+
+
+def _reset_after_fork():
+    for journal in list(_journals):
+        journal._forked()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _try_lock(path):
+    # A descriptor holding the exclusive flock on ``<path>.lock``, or None
+    # while another process holds it.
+    fd = os.open(path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+class Journal(object):
+    """Append-only log and snapshots persisting one in-memory store.
+
+    Each write is appended to ``<path>.<sequence>.log`` as a length-prefixed,
+    checksummed entry. After ``snapshot_every`` entries a background thread
+    starts a new log, writes the store's current state to
+    ``<path>.snapshot`` (atomically, through a temporary file) and deletes
+    the logs it covers. :meth:`open` reads the snapshot through ``mmap`` and
+    replays only the logs written since, stopping at a torn entry left by a
+    crash.
+
+    Entries are whole ``PUT`` / ``DELETE`` operations on a key, so replaying
+    one the snapshot already reflects is harmless. Writers must hold
+    :attr:`lock` while they change the store and :meth:`append` the entry,
+    so the log keeps the store's order.
+
+    A journal belongs to the one process that opened it, which holds an
+    exclusive ``flock`` on ``<path>.lock`` until :meth:`close`; opening it
+    anywhere else raises ``RuntimeError``. A forked child drops what it
+    inherited and has to :meth:`open` the journal itself. When ``path``
+    contains ``{worker}``, each process instead takes the lowest number
+    whose journal no other process holds, so every worker of a pre-fork
+    server keeps its own journal and finds it again after a restart.
+    """
+
+    def __init__(self, path, snapshot_every=100000, fsync=False):
+        self.path = path
+        self._template = path if '{worker}' in path else None
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.lock = threading.RLock()
+        self._dump = None
+        self._file = None
+        self._sequence = 0
+        self._appended = 0
+        self._snapshotting = False
+        self._pid = None
+        self._lockfile = None
+        self.opened = False
+        _journals.add(self)
+
+    @property
+    def snapshot_path(self):
+        return self.path + '.snapshot'
+
+    def _log_path(self, sequence):
+        return '%s.%08d.log' % (self.path, sequence)
+
+    def _logs(self):
+        directory, prefix = os.path.split(os.path.abspath(self.path))
+        sequences = []
+        for name in os.listdir(directory):
+            middle = name[len(prefix) + 1:-len('.log')]
+            if name.startswith(prefix + '.') and name.endswith('.log') and \
+                    middle.isdigit():
+                sequences.append(int(middle))
+        return sorted(sequences)
+
+    def open(self, apply, dump):
+        """Restore the store and start logging.
+
+        ``apply(op, number, fields)`` is called for every entry of the
+        snapshot and the newer logs, in order; ``dump()`` yields the
+        ``(op, number, fields)`` of the store's live entries for the next
+        snapshot. Returns the number of entries replayed, 0 when the journal
+        is already open.
+        """
+        with self.lock:
+            if self.opened:
+                return 0
+            self._lockfile = self._acquire()
+            try:
+                count = self._open(apply, dump)
+            except BaseException:
+                self._release()
+                raise
+            self.opened = True
+        return count
+
+    def _acquire(self):
+        if self._template is None:
+            fd = _try_lock(self.path)
+            if fd is None:
+                raise RuntimeError(
+                    'Journal %s is open in another process; put {worker} in '
+                    'the path to give each process its own.' % self.path
+                )
+            return fd
+
+        worker = 0
+        while True:
+            path = self._template.replace('{worker}', str(worker))
+            fd = _try_lock(path)
+            if fd is not None:
+                self.path = path
+                return fd
+            worker += 1
+
+    def _release(self):
+        if self._lockfile is not None:
+            os.close(self._lockfile)
+            self._lockfile = None
+
+    def _open(self, apply, dump):
+        # Caller holds the lock and the flock.
+        self._dump = dump
+        self._appended = 0
+        covered = count = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'rb') as f:
+                magic, covered, expected = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError('%s is not a snapshot.' % self.snapshot_path)
+            count, _ = _read(self.snapshot_path, apply, HEADER.size)
+            if count != expected:
+                raise ValueError('%s is truncated or corrupt.'
+                                 % self.snapshot_path)
+
+        sequences = [s for s in self._logs() if s >= covered]
+        self._sequence = sequences[-1] if sequences else covered
+        for sequence in sequences:
+            replayed, end = _read(self._log_path(sequence), apply)
+            count += replayed
+            if sequence == self._sequence:
+                # Drop a torn entry so new ones are appended after the
+                # last intact one.
+                with open(self._log_path(sequence), 'ab') as f:
+                    f.truncate(end)
+            self._appended += replayed
+
+        self._file = open(self._log_path(self._sequence), 'ab', buffering=0)
+        self._pid = os.getpid()
+        return count
+
+    def _forked(self):
+        # The parent keeps the log and the flock; closing the child's copies
+        # of their descriptors releases neither.
+        self.lock = threading.RLock()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._release()
+        self._snapshotting = False
+        self.opened = False
+        if self._template is not None:
+            self.path = self._template
+
+    def append(self, entries):
+        """Log ``(op, number, fields)`` entries; the caller holds :attr:`lock`."""
+        if self._pid != os.getpid():
+            raise RuntimeError('Journal %s was opened by another process.'
+                               % self.path)
+        if not entries:
+            return
+        self._file.write(b''.join(encode(*entry) for entry in entries))
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+        self._appended += len(entries)
+        if self.snapshot_every and self._appended >= self.snapshot_every and \
+                not self._snapshotting:
+            self._snapshotting = True
+            threading.Thread(
+                target=self._snapshot_in_background,
+                name='flask-forward-snapshot',
+                daemon=True
+            ).start()
+
+    def _snapshot_in_background(self):
+        try:
+            self.snapshot()
+        except Exception:
+            log.exception('Snapshot of %s failed', self.path)
+        finally:
+            self._snapshotting = False
+
+    def snapshot(self):
+        """Write the store's state to the snapshot and drop older logs."""
+        with self.lock:
+            self._file.close()
+            self._sequence += 1
+            self._file = open(self._log_path(self._sequence), 'ab', buffering=0)
+            self._appended = 0
+            covered = self._sequence
+
+        # Writes made from here on go to the new log, which is replayed on
+        # top of this snapshot.
+        tmp = self.snapshot_path + '.tmp'
+        count = 0
+        with open(tmp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, covered, 0))
+            for op, number, fields in self._dump():
+                f.write(encode(op, number, fields))
+                count += 1
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, covered, count))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+
+        for sequence in self._logs():
+            if sequence < covered:
+                os.remove(self._log_path(sequence))
+        return count
+
+    def close(self):
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._release()
+            self.opened = False
@@ -0,0 +1,539 @@
+import json
+import time
+from threading import Lock
+
+from ..cache import ClientRecord
+from ..redirects import RedirectIndex
+from ..scopes import split_scopes
+
+
+def _default_user_key(user):
+    # Users are indexed by themselves when hashable (ids, names), otherwise
+    # by an ``id`` key or attribute; unindexable users are not indexed.
+    if user is None:
+        return None
+    try:
+        hash(user)
+        return user
+    except TypeError:
+        pass
+    if isinstance(user, dict):
+        return user.get('id')
+    return getattr(user, 'id', None)
+
+
+class TokenRecord(object):
+    """A stored access token."""
+
+    __slots__ = ('token', 'client_id', 'user', 'user_key', 'scopes',
+                 'expires_at', 'refresh_token')
+
+    def __init__(self, token, client_id, user, user_key, scopes, expires_at,
+                 refresh_token=None):
+        self.token = token
+        self.client_id = client_id
+        self.user = user
+        self.user_key = user_key
+        self.scopes = scopes
+        self.expires_at = expires_at
+        self.refresh_token = refresh_token
+
+
+class TimingWheel(object):
+    """Hierarchical timing wheel of expiry deadlines.
+
+    Level 0 has ``slots`` buckets of ``resolution`` seconds each, every
+    following level covers ``slots`` times the span of the one below, and
+    deadlines beyond the last level wait in an overflow bucket. Adding a key
+    is O(1); :meth:`advance` visits one bucket per elapsed tick and cascades
+    higher-level buckets down as the lower wheel wraps, so each key is
+    touched a bounded number of times (once per level) before it expires.
+    """
+
+    def __init__(self, resolution=1.0, slots=64, levels=4, clock=time.time):
+        self.resolution = resolution
+        self.slots = slots
+        self.levels = levels
+        self._clock = clock
+        self._lock = Lock()
+        self._wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self._overflow = []
+        self._tick = int(clock() / resolution)
+
+    def _place(self, key, deadline_tick):
+        delta = deadline_tick - self._tick
+        if delta <= 0:
+            delta = 1
+            deadline_tick = self._tick + 1
+        span = 1
+        for level in range(self.levels):
+            if delta < span * self.slots:
+                slot = (deadline_tick // span) % self.slots
+                self._wheels[level][slot].append((key, deadline_tick))
+                return
+            span *= self.slots
+        self._overflow.append((key, deadline_tick))
+
+    def add(self, key, expires_at):
+        deadline_tick = -(-expires_at // self.resolution)
+        with self._lock:
+            self._place(key, int(deadline_tick))
+
+    def advance(self, now=None):
+        """Return the keys whose deadline has passed."""
+        target = int((self._clock() if now is None else now) / self.resolution)
+        if target <= self._tick:
+            return []
+
+        expired = []
+        with self._lock:
+            while self._tick < target:
+                self._tick += 1
+                tick = self._tick
+                span = 1
+                for level in range(self.levels):
+                    if level and tick % span:
+                        break
+                    slot = (tick // span) % self.slots
+                    bucket = self._wheels[level][slot]
+                    if bucket:
+                        self._wheels[level][slot] = []
+                        for key, deadline_tick in bucket:
+                            if deadline_tick <= tick:
+                                expired.append(key)
+                            else:
+                                self._place(key, deadline_tick)
+                    span *= self.slots
+                if tick % span == 0 and self._overflow:
+                    overflow, self._overflow = self._overflow, []
+                    for key, deadline_tick in overflow:
+                        if deadline_tick <= tick:
+                            expired.append(key)
+                        else:
+                            self._place(key, deadline_tick)
+        return expired
+
+
+class _StripedIndex(object):
+    """Secondary index from a key to a set of tokens, with striped locks."""
+
+    def __init__(self, stripes):
+        self._mask = stripes - 1
+        self._locks = [Lock() for _ in range(stripes)]
+        self._maps = [{} for _ in range(stripes)]
+
+    def add(self, key, token):
+        i = hash(key) & self._mask
+        with self._locks[i]:
+            self._maps[i].setdefault(key, set()).add(token)
+
+    def discard(self, key, token):
+        i = hash(key) & self._mask
+        with self._locks[i]:
+            tokens = self._maps[i].get(key)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._maps[i][key]
+
+    def get(self, key):
+        i = hash(key) & self._mask
+        with self._locks[i]:
+            return list(self._maps[i].get(key, ()))
+
+
+class MemoryTokenStore(object):
+    """Thread-safe in-memory token store.
+
+    Tokens are spread over ``shards`` dicts (a power of two), each with its
+    own lock, so concurrent workers rarely contend. Secondary indexes map
+    client ids and users to their tokens, and a :class:`TimingWheel`
+    removes expired tokens in amortised O(1) as time advances, without
+    scanning the store.
+    """
+
+    def __init__(self, shards=16, user_key=_default_user_key, clock=time.time,
+                 wheel=None):
+        if shards & (shards - 1):
+            raise ValueError('shards must be a power of two.')
+        self._mask = shards - 1
+        self._locks = [Lock() for _ in range(shards)]
+        self._shards = [{} for _ in range(shards)]
+        self.by_client = _StripedIndex(shards)
+        self.by_user = _StripedIndex(shards)
+        self.by_scope = _StripedIndex(shards)
+        self.user_key = user_key
+        self._clock = clock
+        self.wheel = wheel or TimingWheel(clock=clock)
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+    def _shard(self, token):
+        i = hash(token) & self._mask
+        return self._locks[i], self._shards[i]
+
+    def add(self, token, client_id=None, user=None, scopes=(), expires_in=3600,
+            refresh_token=None):
+        return self.put(TokenRecord(
+            token,
+            client_id,
+            user,
+            self.user_key(user),
+            tuple(split_scopes(scopes)),
+            self._clock() + expires_in,
+            refresh_token
+        ))
+
+    def put(self, record):
+        """Store a ready :class:`TokenRecord`, replacing any for its token."""
+        lock, shard = self._shard(record.token)
+        with lock:
+            previous = shard.get(record.token)
+            shard[record.token] = record
+        if previous is not None:
+            self._unindex(previous)
+        self._index(record)
+        self.wheel.add(record.token, record.expires_at)
+        self.expire()
+        return record
+
+    def get(self, token):
+        lock, shard = self._shard(token)
+        record = shard.get(token)
+        if record is None or record.expires_at <= self._clock():
+            return None
+        return record
+
+    def remove(self, token):
+        lock, shard = self._shard(token)
+        with lock:
+            record = shard.pop(token, None)
+        if record is not None:
+            self._unindex(record)
+        return record
+
+    def records(self):
+        """Every live record, copied one shard at a time."""
+        now = self._clock()
+        for lock, shard in zip(self._locks, self._shards):
+            with lock:
+                records = list(shard.values())
+            for record in records:
+                if record.expires_at > now:
+                    yield record
+
+    def tokens_for_client(self, client_id):
+        return self.by_client.get(client_id)
+
+    def tokens_for_user(self, user):
+        return self.by_user.get(self.user_key(user))
+
+    def tokens_with_scope(self, scope):
+        return self.by_scope.get(scope)
+
+    def expire(self, now=None):
+        """Drop tokens whose expiry has passed; returns how many."""
+        removed = 0
+        now = self._clock() if now is None else now
+        for token in self.wheel.advance(now):
+            lock, shard = self._shard(token)
+            with lock:
+                record = shard.get(token)
+                # A token re-saved with a later expiry keeps its newer entry.
+                if record is None or record.expires_at > now:
+                    continue
+                del shard[token]
+            self._unindex(record)
+            removed += 1
+        return removed
+
+    def _index(self, record):
+        if record.client_id is not None:
+            self.by_client.add(record.client_id, record.token)
+        if record.user_key is not None:
+            self.by_user.add(record.user_key, record.token)
+        for scope in record.scopes:
+            self.by_scope.add(scope, record.token)
+
+    def _unindex(self, record):
+        if record.client_id is not None:
+            self.by_client.discard(record.client_id, record.token)
+        if record.user_key is not None:
+            self.by_user.discard(record.user_key, record.token)
+        for scope in record.scopes:
+            self.by_scope.discard(scope, record.token)
+
+
+# Journal operations (see flask_forward.stores.journal).
+_PUT = 1
+_DELETE = 2
+
+
+def _journal(journal):
+    # Imported here so stores without a journal never load mmap.
+    from .journal import Journal
+    if isinstance(journal, Journal):
+        return journal
+    return Journal(journal)
+
+
+def _ready(service):
+    # Journals are opened, and the store restored, on first use rather than
+    # in __init__, so a service built before a pre-fork server forks is
+    # restored in the worker that uses it.
+    journal = service.journal
+    if journal is not None and not journal.opened:
+        journal.open(service._replay, service._dump)
+
+
+class MemoryTokenService(object):
+    """Token backend implementing the ValidatorService ``token`` contract.
+
+    ``journal`` is a path prefix or a :class:`~flask_forward.stores.journal.Journal`
+    persisting saves and revocations, from which the store is restored on
+    the service's first use in a process; subclass and set the class
+    attribute to configure the one ``FlaskForward`` creates. Users are
+    journaled as JSON, or as their ``user_key`` when they are not
+    serializable.
+    """
+
+    store_cls = MemoryTokenStore
+    journal = None
+
+    def __init__(self, store=None, journal=None):
+        self.store = store if store is not None else self.store_cls()
+        journal = journal if journal is not None else self.journal
+        if journal is not None:
+            self.journal = _journal(journal)
+
+    def save(self, token, request, *args, **kwargs):
+        self._write([(token, request)], ())
+        return True
+
+    def save_many(self, items):
+        self._write(items, ())
+
+    def revoke(self, token, token_type_hint, request, *args, **kwargs):
+        self._write((), [token])
+
+    def revoke_many(self, items):
+        self._write((), [item[0] for item in items])
+
+    def _write(self, saves, revokes):
+        _ready(self)
+        if self.journal is None:
+            self._apply(saves, revokes)
+            return
+        with self.journal.lock:
+            self.journal.append(self._apply(saves, revokes))
+
+    def _apply(self, saves, revokes):
+        # Returns the journal entries of the writes.
+        entries = []
+        for item in saves:
+            token, request = item[0], item[1]
+            entries.append(self._entry(self.store.add(
+                token['access_token'],
+                client_id=request.client_id,
+                user=request.user,
+                scopes=token.get('scope') or request.scopes,
+                expires_in=token.get('expires_in', 3600),
+                refresh_token=token.get('refresh_token')
+            )))
+        for token in revokes:
+            self.store.remove(token)
+            entries.append((_DELETE, 0.0, (token,)))
+        return entries
+
+    def _entry(self, record):
+        try:
+            user = json.dumps(record.user)
+        except TypeError:
+            user = json.dumps(record.user_key)
+        return _PUT, record.expires_at, (
+            record.token,
+            record.client_id,
+            user,
+            ' '.join(record.scopes),
+            record.refresh_token
+        )
+
+    def _dump(self):
+        for record in self.store.records():
+            yield self._entry(record)
+
+    def _replay(self, op, number, fields):
+        if op == _DELETE:
+            self.store.remove(fields[0])
+            return
+        token, client_id, user, scopes, refresh_token = fields
+        user = json.loads(user)
+        self.store.put(TokenRecord(
+            token,
+            client_id,
+            user,
+            self.store.user_key(user),
+            tuple(scopes.split()),
+            number,
+            refresh_token
+        ))
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+
+    def find_tokens(self, client_id=None, user=None, scope=None):
+        """Tokens matching every given criterion, looked up by index."""
+        _ready(self)
+        matches = None
+        for criterion, lookup in ((client_id, self.store.tokens_for_client),
+                                  (user, self.store.tokens_for_user),
+                                  (scope, self.store.tokens_with_scope)):
+            if criterion is None:
+                continue
+            tokens = set(lookup(criterion))
+            matches = tokens if matches is None else matches & tokens
+        return list(matches or ())
+
+    def introspect_many(self, tokens):
+        """Attributes of the active tokens among ``tokens``, by token."""
+        _ready(self)
+        found = {}
+        for token in tokens:
+            record = self.store.get(token)
+            if record is not None:
+                found[token] = {
+                    'client_id': record.client_id,
+                    'user': record.user,
+                    'scopes': list(record.scopes),
+                    'expires_at': record.expires_at,
+                }
+        return found
+
+    def is_revoked(self, token, request=None):
+        """Whether a signed token was revoked: it is no longer stored."""
+        _ready(self)
+        return self.store.get(token) is None
+
+    def validate(self, token, scopes, request):
+        _ready(self)
+        record = self.store.get(token)
+        if record is None:
+            return False
+        if not set(split_scopes(scopes)).issubset(record.scopes):
+            # Tells auth_required the token is valid but under-scoped.
+            request.scopes = list(record.scopes)
+            return False
+
+        request.client_id = record.client_id
+        request.user = record.user
+        request.scopes = list(record.scopes)
+        request.expires_at = record.expires_at
+        return True
+
+
+class MemoryClientService(object):
+    """Client backend implementing the ValidatorService ``client`` contract.
+
+    Clients are added with :meth:`register`, using the same keys as the
+    mapping ``get_client`` returns (see :class:`~flask_forward.cache.ClientRecord`).
+    Registrations are kept in ``journal`` when one is set, as for
+    :class:`MemoryTokenService`; they must then be JSON serializable.
+    """
+
+    journal = None
+
+    def __init__(self, journal=None):
+        self._lock = Lock()
+        self._clients = {}
+        self.redirects = RedirectIndex()
+        journal = journal if journal is not None else self.journal
+        if journal is not None:
+            self.journal = _journal(journal)
+
+    def register(self, client_id, **registration):
+        _ready(self)
+        if self.journal is None:
+            return self._register(client_id, registration)
+        with self.journal.lock:
+            record = self._register(client_id, registration)
+            self.journal.append([self._entry(record)])
+        return record
+
+    def unregister(self, client_id):
+        _ready(self)
+        if self.journal is None:
+            self._unregister(client_id)
+            return
+        with self.journal.lock:
+            self._unregister(client_id)
+            self.journal.append([(_DELETE, 0.0, (client_id,))])
+
+    def _register(self, client_id, registration):
+        record = ClientRecord(client_id, registration)
+        with self._lock:
+            self._clients[client_id] = record
+        self.redirects.update(client_id, record.redirect_uris)
+        return record
+
+    def _unregister(self, client_id):
+        with self._lock:
+            self._clients.pop(client_id, None)
+        self.redirects.remove(client_id)
+
+    def _entry(self, record):
+        return _PUT, 0.0, (record.client_id, None, json.dumps(record.data))
+
+    def _dump(self):
+        with self._lock:
+            records = list(self._clients.values())
+        for record in records:
+            yield self._entry(record)
+
+    def _replay(self, op, number, fields):
+        if op == _DELETE:
+            self._unregister(fields[0])
+        else:
+            self._register(fields[0], json.loads(fields[2]))
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+
+    def get_client(self, client_id, request=None):
+        _ready(self)
+        record = self._clients.get(client_id)
+        return record.data if record is not None else None
+
+    def get_redirect_uri(self, client_id, request, *args, **kwargs):
+        _ready(self)
+        record = self._clients.get(client_id)
+        return record.default_redirect_uri if record is not None else None
+
+    def get_scopes(self, client_id, request, *args, **kwargs):
+        _ready(self)
+        record = self._clients.get(client_id)
+        return list(record.scopes) if record is not None else []
+
+    def validate_client_id(self, client_id, request, *args, **kwargs):
+        _ready(self)
+        record = self._clients.get(client_id)
+        if record is None or not record.active:
+            return False
+        request.client = record
+        return True
+
+    def validate_redirect_uri(self, client_id, redirect_uri, request, *args, **kwargs):
+        _ready(self)
+        return self.redirects.match(client_id, redirect_uri)
+
+    def validate_response_type(self, client_id, response_type, client, request, *args, **kwargs):
+        _ready(self)
+        record = self._clients.get(client_id)
+        return record is not None and response_type in record.response_types
+
+    def validate_scopes(self, client_id, scopes, client, request, *args, **kwargs):
+        _ready(self)
+        record = self._clients.get(client_id)
+        return record is not None and record.allowed_scopes.issuperset(scopes)
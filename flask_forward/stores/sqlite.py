@@ -0,0 +1,337 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from ..cache import ClientRecord
+from ..redirects import RedirectIndex
+from ..scopes import split_scopes
+from .memory import _default_user_key
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS ff_tokens (
+        token TEXT PRIMARY KEY,
+        client_id TEXT,
+        user_key TEXT,
+        scopes TEXT NOT NULL,
+        expires_at REAL NOT NULL,
+        refresh_token TEXT
+    ) WITHOUT ROWID""",
+    # Token lookups by client and user are answered from these indexes
+    # alone; the primary key rides along in every WITHOUT ROWID index.
+    'CREATE INDEX IF NOT EXISTS ff_tokens_client ON ff_tokens (client_id)',
+    'CREATE INDEX IF NOT EXISTS ff_tokens_user ON ff_tokens (user_key)',
+    'CREATE INDEX IF NOT EXISTS ff_tokens_expiry ON ff_tokens (expires_at)',
+    """CREATE TABLE IF NOT EXISTS ff_token_scopes (
+        scope TEXT NOT NULL,
+        token TEXT NOT NULL,
+        PRIMARY KEY (scope, token)
+    ) WITHOUT ROWID""",
+    'CREATE INDEX IF NOT EXISTS ff_token_scopes_token ON ff_token_scopes (token)',
+    """CREATE TABLE IF NOT EXISTS ff_clients (
+        client_id TEXT PRIMARY KEY,
+        data TEXT NOT NULL
+    ) WITHOUT ROWID""",
+)
+
+# Statements are module constants so sqlite3's per-connection statement
+# cache prepares each of them once per connection.
+INSERT_TOKEN = (
+    'INSERT OR REPLACE INTO ff_tokens '
+    '(token, client_id, user_key, scopes, expires_at, refresh_token) '
+    'VALUES (?, ?, ?, ?, ?, ?)'
+)
+INSERT_SCOPE = 'INSERT OR IGNORE INTO ff_token_scopes (scope, token) VALUES (?, ?)'
+DELETE_TOKEN = 'DELETE FROM ff_tokens WHERE token = ?'
+DELETE_SCOPES = 'DELETE FROM ff_token_scopes WHERE token = ?'
+SELECT_TOKEN = (
+    'SELECT client_id, user_key, scopes, expires_at FROM ff_tokens '
+    'WHERE token = ? AND expires_at > ?'
+)
+SELECT_TOKENS = (
+    'SELECT token, client_id, user_key, scopes, expires_at FROM ff_tokens '
+    'WHERE expires_at > ? AND token IN (%s)'
+)
+# Stays below SQLite's default limit on bound parameters.
+SELECT_TOKENS_CHUNK = 500
+SELECT_BY_CLIENT = 'SELECT token FROM ff_tokens WHERE client_id = ?'
+SELECT_BY_USER = 'SELECT token FROM ff_tokens WHERE user_key = ?'
+SELECT_BY_SCOPE = 'SELECT token FROM ff_token_scopes WHERE scope = ?'
+SELECT_EXPIRED = 'SELECT token FROM ff_tokens WHERE expires_at <= ?'
+UPSERT_CLIENT = 'INSERT OR REPLACE INTO ff_clients (client_id, data) VALUES (?, ?)'
+DELETE_CLIENT = 'DELETE FROM ff_clients WHERE client_id = ?'
+SELECT_CLIENT = 'SELECT data FROM ff_clients WHERE client_id = ?'
+
+
+class SQLiteDatabase(object):
+    """A SQLite database with one connection per thread.
+
+    Connections are opened lazily, in WAL mode so readers never block the
+    writer, closed when their thread exits and reopened after a fork.
+    ``cached_statements`` bounds each connection's prepared statement cache.
+    """
+
+    def __init__(self, path, timeout=5.0, cached_statements=64):
+        self.path = path
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._connections = weakref.WeakSet()
+        self._pid = os.getpid()
+
+        with self.transaction() as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+    def connection(self):
+        if self._pid != os.getpid():
+            # Connections must not cross a fork; the child starts afresh.
+            self._local = threading.local()
+            self._connections = weakref.WeakSet()
+            self._pid = os.getpid()
+
+        holder = getattr(self._local, 'holder', None)
+        if holder is None:
+            conn = sqlite3.connect(
+                self.path,
+                timeout=self.timeout,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=self.cached_statements
+            )
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            holder = self._local.holder = _Connection(conn)
+            self._connections.add(holder)
+        return holder.conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def close(self):
+        for holder in list(self._connections):
+            holder.close()
+        self._local = threading.local()
+
+
+class _Connection(object):
+    """Holds a thread's connection and closes it once the thread is gone.
+
+    Only the thread-local refers to the holder, so when a thread exits the
+    holder is collected and its finalizer closes the connection.
+    """
+
+    __slots__ = ('conn', 'close', '__weakref__')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.close = weakref.finalize(self, conn.close)
+
+
+def _database(database):
+    if isinstance(database, SQLiteDatabase):
+        return database
+    return SQLiteDatabase(database)
+
+
+class SQLiteTokenService(object):
+    """Token backend implementing the ValidatorService ``token`` contract.
+
+    ``database`` is a path or a shared :class:`SQLiteDatabase`; subclass and
+    set the class attribute to configure the one ``FlaskForward`` creates.
+    Users are stored by key (see ``user_key``), and a validated request's
+    ``user`` is that key.
+    """
+
+    database = 'flask_forward.db'
+
+    def __init__(self, database=None, user_key=_default_user_key,
+                 clock=time.time):
+        self.db = _database(database if database is not None else self.database)
+        self.user_key = user_key
+        self._clock = clock
+
+    def _row(self, token, request):
+        user_key = self.user_key(request.user)
+        scopes = split_scopes(token.get('scope') or request.scopes)
+        row = (
+            token['access_token'],
+            request.client_id,
+            None if user_key is None else str(user_key),
+            ' '.join(scopes),
+            self._clock() + token.get('expires_in', 3600),
+            token.get('refresh_token')
+        )
+        return row, [(scope, row[0]) for scope in scopes]
+
+    def save(self, token, request, *args, **kwargs):
+        self.save_many([(token, request)])
+        return True
+
+    def save_many(self, items):
+        rows, scopes = [], []
+        for token, request in items:
+            row, row_scopes = self._row(token, request)
+            rows.append(row)
+            scopes.extend(row_scopes)
+
+        with self.db.transaction() as conn:
+            # A re-saved token must not keep the scopes of its old row.
+            conn.executemany(DELETE_SCOPES, [(row[0],) for row in rows])
+            conn.executemany(INSERT_TOKEN, rows)
+            conn.executemany(INSERT_SCOPE, scopes)
+
+    def revoke(self, token, token_type_hint, request, *args, **kwargs):
+        self.revoke_many([(token, token_type_hint, request)])
+
+    def revoke_many(self, items):
+        tokens = [(item[0],) for item in items]
+        with self.db.transaction() as conn:
+            conn.executemany(DELETE_TOKEN, tokens)
+            conn.executemany(DELETE_SCOPES, tokens)
+
+    def find_tokens(self, client_id=None, user=None, scope=None):
+        """Tokens matching every given criterion, looked up by index."""
+        conn = self.db.connection()
+        matches = None
+        for criterion, sql in ((client_id, SELECT_BY_CLIENT),
+                               (user, SELECT_BY_USER),
+                               (scope, SELECT_BY_SCOPE)):
+            if criterion is None:
+                continue
+            if sql is SELECT_BY_USER:
+                criterion = self.user_key(criterion)
+                if criterion is None:
+                    return []
+                criterion = str(criterion)
+            tokens = set(row[0] for row in conn.execute(sql, (criterion,)))
+            matches = tokens if matches is None else matches & tokens
+        return list(matches or ())
+
+    def expire(self, now=None):
+        """Delete tokens whose expiry has passed; returns how many."""
+        now = self._clock() if now is None else now
+        conn = self.db.connection()
+        tokens = conn.execute(SELECT_EXPIRED, (now,)).fetchall()
+        if tokens:
+            with self.db.transaction() as conn:
+                conn.executemany(DELETE_TOKEN, tokens)
+                conn.executemany(DELETE_SCOPES, tokens)
+        return len(tokens)
+
+    def introspect_many(self, tokens):
+        """Attributes of the active tokens among ``tokens``, by token."""
+        conn = self.db.connection()
+        now = self._clock()
+        found = {}
+        for start in range(0, len(tokens), SELECT_TOKENS_CHUNK):
+            chunk = list(tokens[start:start + SELECT_TOKENS_CHUNK])
+            sql = SELECT_TOKENS % ', '.join('?' * len(chunk))
+            for row in conn.execute(sql, [now] + chunk):
+                found[row[0]] = {
+                    'client_id': row[1],
+                    'user': row[2],
+                    'scopes': row[3].split(),
+                    'expires_at': row[4],
+                }
+        return found
+
+    def is_revoked(self, token, request=None):
+        """Whether a signed token was revoked: it is no longer stored."""
+        return self.db.connection().execute(
+            SELECT_TOKEN,
+            (token, self._clock())
+        ).fetchone() is None
+
+    def validate(self, token, scopes, request):
+        row = self.db.connection().execute(
+            SELECT_TOKEN,
+            (token, self._clock())
+        ).fetchone()
+        if row is None:
+            return False
+        granted = row[2].split()
+        if not set(split_scopes(scopes)).issubset(granted):
+            # Tells auth_required the token is valid but under-scoped.
+            request.scopes = granted
+            return False
+
+        request.client_id = row[0]
+        request.user = row[1]
+        request.scopes = granted
+        request.expires_at = row[3]
+        return True
+
+
+class SQLiteClientService(object):
+    """Client backend implementing the ValidatorService ``client`` contract.
+
+    Registrations are stored as JSON, with the same keys as the mapping
+    ``get_client`` returns (see :class:`~flask_forward.cache.ClientRecord`).
+    Pair it with ``FORWARD_CLIENT_CACHE_TTL`` so that an authorization
+    request reads each client once instead of once per check.
+    """
+
+    database = 'flask_forward.db'
+
+    def __init__(self, database=None):
+        self.db = _database(database if database is not None else self.database)
+
+    def register(self, client_id, **registration):
+        with self.db.transaction() as conn:
+            conn.execute(UPSERT_CLIENT, (client_id, json.dumps(registration)))
+        return ClientRecord(client_id, registration)
+
+    def unregister(self, client_id):
+        with self.db.transaction() as conn:
+            conn.execute(DELETE_CLIENT, (client_id,))
+
+    def get_client(self, client_id, request=None):
+        row = self.db.connection().execute(SELECT_CLIENT, (client_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def _record(self, client_id):
+        data = self.get_client(client_id)
+        return ClientRecord(client_id, data) if data is not None else None
+
+    def get_redirect_uri(self, client_id, request, *args, **kwargs):
+        record = self._record(client_id)
+        return record.default_redirect_uri if record is not None else None
+
+    def get_scopes(self, client_id, request, *args, **kwargs):
+        record = self._record(client_id)
+        return list(record.scopes) if record is not None else []
+
+    def validate_client_id(self, client_id, request, *args, **kwargs):
+        record = self._record(client_id)
+        if record is None or not record.active:
+            return False
+        request.client = record
+        return True
+
+    def validate_redirect_uri(self, client_id, redirect_uri, request, *args, **kwargs):
+        record = self._record(client_id)
+        if record is None:
+            return False
+        redirects = RedirectIndex()
+        redirects.update(client_id, record.redirect_uris)
+        return redirects.match(client_id, redirect_uri)
+
+    def validate_response_type(self, client_id, response_type, client, request, *args, **kwargs):
+        record = self._record(client_id)
+        return record is not None and response_type in record.response_types
+
+    def validate_scopes(self, client_id, scopes, client, request, *args, **kwargs):
+        record = self._record(client_id)
+        return record is not None and record.allowed_scopes.issuperset(scopes)
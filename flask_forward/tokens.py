@@ -0,0 +1,237 @@
+import base64
+import hashlib
+import heapq
+import hmac
+import json
+import os
+import time
+import weakref
+from threading import Lock, Thread
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+class RevocationList(object):
+    """In-process set of explicitly revoked signed token ids.
+
+    Entries are only kept until the token they refer to would have expired
+    anyway, so the set stays proportional to the number of live revocations.
+    """
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._lock = Lock()
+        self._revoked = {}
+        self._expiries = []
+
+    def add(self, jti, expires_at):
+        with self._lock:
+            self._revoked[jti] = expires_at
+            heapq.heappush(self._expiries, (expires_at, jti))
+            self._prune()
+
+    def __contains__(self, jti):
+        return jti in self._revoked
+
+    def __len__(self):
+        return len(self._revoked)
+
+    def _prune(self):
+        # Only entries at the front of the expiry heap are looked at, so a
+        # bulk revocation stays linear in the number of tokens revoked.
+        now = self._clock()
+        expiries = self._expiries
+        while expiries and expiries[0][0] <= now:
+            exp, jti = heapq.heappop(expiries)
+            if self._revoked.get(jti) == exp:
+                del self._revoked[jti]
+
+
+class SignedTokenCodec(object):
+    """Issue and verify self-contained HMAC-SHA256 signed access tokens.
+
+    A token has the form ``<key id>.<payload>.<signature>`` where the
+    payload carries the client id, granted scopes, expiry and a random
+    token id. New tokens are signed with ``active_key_id``; every key in
+    ``keys`` is accepted for verification, which allows keys to be rotated
+    without invalidating tokens that are still in flight.
+    """
+
+    def __init__(self, keys, active_key_id=None, revocations=None,
+                 clock=time.time):
+        if not keys:
+            raise ValueError('At least one signing key is required.')
+
+        self.keys = dict(
+            (kid, key.encode('utf-8') if isinstance(key, str) else key)
+            for kid, key in keys.items()
+        )
+        self.active_key_id = active_key_id or sorted(self.keys)[-1]
+        if self.active_key_id not in self.keys:
+            raise ValueError('Unknown active key id %r.' % self.active_key_id)
+
+        self.revocations = revocations if revocations is not None \
+            else RevocationList(clock)
+        self._clock = clock
+
+    def _sign(self, kid, payload):
+        return hmac.new(self.keys[kid], payload, hashlib.sha256).digest()
+
+    def encode(self, client_id, scopes, expires_in):
+        claims = {
+            'cid': client_id,
+            'scp': list(scopes or ()),
+            'exp': int(self._clock() + expires_in),
+            'jti': _b64encode(os.urandom(12)),
+        }
+        kid = self.active_key_id
+        payload = _b64encode(
+            json.dumps(claims, separators=(',', ':')).encode('utf-8')
+        )
+        signed = ('%s.%s' % (kid, payload)).encode('ascii')
+        return '%s.%s' % (signed.decode('ascii'), _b64encode(self._sign(kid, signed)))
+
+    def generate(self, request):
+        """Token generator suitable for oauthlib's BearerToken."""
+        return self.encode(
+            request.client_id,
+            request.scopes,
+            request.expires_in or 3600
+        )
+
+    def owns(self, token):
+        """Whether ``token`` is shaped like a token issued by this codec."""
+        try:
+            return token.count('.') == 2 and token.partition('.')[0] in self.keys
+        except AttributeError:
+            return False
+
+    def decode(self, token):
+        """Return the claims of a validly signed token, otherwise ``None``.
+
+        Expiry is not checked here; see :meth:`verify`.
+        """
+        try:
+            kid, payload, signature = token.split('.')
+        except (AttributeError, ValueError):
+            return None
+
+        if kid not in self.keys:
+            return None
+
+        try:
+            expected = self._sign(kid, ('%s.%s' % (kid, payload)).encode('ascii'))
+            if not hmac.compare_digest(expected, _b64decode(signature)):
+                return None
+            return json.loads(_b64decode(payload).decode('utf-8'))
+        except (ValueError, UnicodeError):
+            return None
+
+    def is_active(self, claims):
+        return claims['exp'] > self._clock() \
+            and claims['jti'] not in self.revocations
+
+    def verify(self, token):
+        """Return the claims of a valid, unexpired, unrevoked token."""
+        claims = self.decode(token)
+        if claims is None or not self.is_active(claims):
+            return None
+        return claims
+
+    def revoke(self, token):
+        claims = self.decode(token)
+        if claims is not None:
+            self.revocations.add(claims['jti'], claims['exp'])
+        return claims is not None
+
+
+_generators = weakref.WeakSet()
+
+
+def _reset_after_fork():
+    for generator in list(_generators):
+        generator._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class BufferedTokenGenerator(object):
+    """Token generator for oauthlib's BearerToken that draws entropy in bulk.
+
+    Each token is ``nbytes`` bytes from ``os.urandom`` (24 by default, 192
+    bits, against the ~179 bits of oauthlib's 30 alphanumerics) encoded as
+    unpadded URL-safe base64. Entropy for ``batch`` tokens is read in one
+    call and encoded in one pass into a list of ready tokens; once half of
+    it is handed out the next batch is prepared in a background thread.
+    Every byte is used for exactly one token, and handed out tokens are
+    dropped from the buffer.
+
+    A forked child discards its inherited buffers, which the parent will
+    hand out too, and starts afresh.
+    """
+
+    def __init__(self, nbytes=24, batch=4096, background=True):
+        if nbytes % 3 or nbytes < 18:
+            raise ValueError('nbytes must be a multiple of 3 and at least 18.')
+        self.nbytes = nbytes
+        self.batch = batch
+        self.background = background
+        self._width = nbytes // 3 * 4
+        self._reset()
+        _generators.add(self)
+
+    def _reset(self):
+        self._lock = Lock()
+        self._tokens = []
+        self._next = 0
+        self._spare = None
+        self._refilling = False
+        self._pid = os.getpid()
+
+    def _fill(self):
+        encoded = base64.urlsafe_b64encode(
+            os.urandom(self.nbytes * self.batch)
+        ).decode('ascii')
+        width = self._width
+        return [encoded[i:i + width] for i in range(0, len(encoded), width)]
+
+    def __call__(self, request=None):
+        if self._pid != os.getpid():
+            # Forked without the at-fork hook (e.g. through a C extension).
+            self._reset()
+
+        with self._lock:
+            i = self._next
+            if i >= len(self._tokens):
+                tokens, self._spare = self._spare, None
+                self._tokens = tokens if tokens is not None else self._fill()
+                i = 0
+            self._next = i + 1
+            token = self._tokens[i]
+            self._tokens[i] = None
+
+            if self.background and i == self.batch // 2 and \
+                    self._spare is None and not self._refilling:
+                self._refilling = True
+                Thread(
+                    target=self._refill,
+                    args=(self._pid,),
+                    name='flask-forward-tokens',
+                    daemon=True
+                ).start()
+        return token
+
+    def _refill(self, pid):
+        tokens = self._fill()
+        with self._lock:
+            if self._pid == pid:
+                self._spare = tokens
+                self._refilling = False
@@ -0,0 +1,249 @@
+import atexit
+import logging
+import os
+import time
+from collections import deque
+from itertools import islice
+from threading import Condition, Event, Lock, Thread
+
+from ._async import resolve
+from .scopes import ScopeRegistry, split_scopes
+
+log = logging.getLogger(__name__)
+
+_SAVE = 'save'
+_REVOKE = 'revoke'
+
+
+class WriteBehindQueue(object):
+    """Buffer token saves and revocations and write them to the store in bulk.
+
+    Writes are queued in memory and flushed by a background thread once
+    ``batch_size`` operations are waiting or ``flush_interval`` seconds have
+    passed, through the token backend's ``save_many`` / ``revoke_many``
+    methods (falling back to ``save`` / ``revoke`` per item when a backend
+    does not implement them). Operations keep their order; consecutive
+    operations of the same kind are sent as one batch.
+
+    Until a write has reached the store, :meth:`lookup` answers validations
+    for the affected token from memory, so a freshly issued token is usable
+    straight away and a revoked one is rejected straight away. A batch the
+    store fails to write stays queued, ahead of everything after it, and is
+    retried after ``retry_interval`` seconds, doubling up to
+    ``max_retry_interval``.
+
+    All store writes, including :meth:`flush` and the caller-side writes
+    below, are serialised on one lock and always start from the oldest
+    queued operation, so the store sees operations in the order they were
+    made. The queue holds at most ``maxsize`` operations. When it is full,
+    the caller waits up to ``put_timeout`` seconds and then flushes the
+    queue itself, which throttles issuance to the store's pace.
+    """
+
+    def __init__(self, backend, batch_size=100, flush_interval=0.05,
+                 maxsize=10000, put_timeout=1.0, scope_registry=None,
+                 retry_interval=0.1, max_retry_interval=5.0):
+        self.backend = backend
+        self.scope_registry = scope_registry if scope_registry is not None \
+            else ScopeRegistry()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.maxsize = maxsize
+        self.put_timeout = put_timeout
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self._ops = deque()
+        # Operations ever queued and ever written, for flush().
+        self._queued = self._written = 0
+        self._lock = Lock()
+        self._ready = Condition(self._lock)
+        self._not_full = Condition(self._lock)
+        self._write_lock = Lock()
+        self._stopping = Event()
+        self._saved = {}
+        self._revoked = {}
+        self._thread = None
+        self._pid = None
+        self._closed = False
+
+    def save(self, token, request, *args, **kwargs):
+        scopes = split_scopes(token.get('scope'))
+        entry = (
+            request.client_id,
+            scopes,
+            self.scope_registry.mask(scopes),
+            time.time() + token.get('expires_in', 3600),
+            request.user
+        )
+        self._put(_SAVE, token['access_token'], entry,
+                  (token, request) + args, kwargs)
+
+    def revoke(self, token, token_type_hint, request, *args, **kwargs):
+        self._put(_REVOKE, token, object(),
+                  (token, token_type_hint, request) + args, kwargs)
+
+    def lookup(self, token, required, request=None):
+        """True or False for tokens with unwritten writes, otherwise None.
+
+        ``required`` is a :class:`~flask_forward.scopes.ScopeRequirement`.
+        """
+        if token in self._revoked:
+            return False
+
+        entry = self._saved.get(token)
+        if entry is None:
+            return None
+
+        client_id, scopes, granted, expires_at, _ = entry
+        if required.mask & ~granted:
+            # Scopes registered after the token was saved are missing from
+            # its bitset; recompute from the names.
+            granted = self.scope_registry.mask(scopes)
+        if expires_at <= time.time() or not required.allows(granted):
+            return False
+        if request is not None:
+            request.client_id = client_id
+            request.scopes = list(scopes)
+            request.expires_at = expires_at
+        return True
+
+    def find_tokens(self, client_id=None, user=None, scope=None):
+        """Tokens with an unwritten save matching every given criterion."""
+        with self._lock:
+            saved = list(self._saved.items())
+        return [
+            token for token, (c, scopes, _, _, u) in saved
+            if (client_id is None or c == client_id) and
+            (user is None or u == user) and
+            (scope is None or scope in scopes)
+        ]
+
+    def flush(self):
+        """Write every queued operation to the store before returning.
+
+        Raises the store's exception when a batch fails; the failed
+        operations stay queued. Operations queued meanwhile by other threads
+        may be left for the worker.
+        """
+        target = self._queued
+        while self._written < target:
+            error = self._write_batch()
+            if error is not None:
+                raise error
+
+    def close(self):
+        self._closed = True
+        self._stopping.set()
+        if self._thread is not None and self._pid == os.getpid():
+            with self._lock:
+                self._ready.notify_all()
+            self._thread.join()
+        try:
+            self.flush()
+        except Exception:
+            log.exception('Write-behind left %d operations unwritten',
+                          len(self._ops))
+
+    def _put(self, kind, token, entry, args, kwargs):
+        if not self._closed:
+            self._ensure_worker()
+        with self._lock:
+            if len(self._ops) >= self.maxsize and not self._closed:
+                self._not_full.wait(self.put_timeout)
+            pending, other = (self._saved, self._revoked) if kind == _SAVE \
+                else (self._revoked, self._saved)
+            pending[token] = entry
+            other.pop(token, None)
+            self._ops.append((kind, token, entry, args, kwargs))
+            self._queued += 1
+            full = len(self._ops) >= self.maxsize
+            if len(self._ops) == 1 or len(self._ops) >= self.batch_size:
+                self._ready.notify()
+
+        if self._closed or full:
+            self.flush()
+
+    def _ensure_worker(self):
+        # Threads do not survive fork, so pre-fork servers get a fresh
+        # worker in every child on first use.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._thread = Thread(
+                target=self._run,
+                name='flask-forward-write-behind',
+                daemon=True
+            )
+            self._thread.start()
+            self._pid = os.getpid()
+            atexit.register(self.close)
+
+    def _run(self):
+        delay = 0.0
+        while True:
+            with self._lock:
+                while not self._ops and not self._closed:
+                    self._ready.wait()
+                if self._closed:
+                    return
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._ops) < self.batch_size and not self._closed:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    self._ready.wait(timeout)
+
+            error = self._write_batch()
+            if error is None:
+                delay = 0.0
+                continue
+            log.error('Write-behind failed, retrying: %r', error)
+            delay = min(max(delay * 2, self.retry_interval),
+                        self.max_retry_interval)
+            if self._stopping.wait(delay):
+                return
+
+    def _write_batch(self):
+        # Writes up to batch_size of the oldest operations. They are only
+        # dequeued, and dropped from the pending maps, once written; returns
+        # the exception that stopped the batch, if any.
+        with self._write_lock:
+            with self._lock:
+                ops = list(islice(self._ops, self.batch_size))
+            written, error = 0, None
+            start = 0
+            for i in range(1, len(ops) + 1):
+                if i == len(ops) or ops[i][0] != ops[start][0]:
+                    error = self._write_run(ops[start:i])
+                    if error is not None:
+                        break
+                    written = i
+                    start = i
+
+            with self._lock:
+                for _ in range(written):
+                    kind, token, entry, _, _ = self._ops.popleft()
+                    pending = self._saved if kind == _SAVE else self._revoked
+                    if pending.get(token) is entry:
+                        del pending[token]
+                self._written += written
+                if written:
+                    self._not_full.notify_all()
+            return error
+
+    def _write_run(self, ops):
+        kind = ops[0][0]
+        try:
+            bulk = getattr(self.backend, kind + '_many', None)
+            if bulk is not None:
+                resolve(bulk([op[3] for op in ops]))
+            else:
+                single = getattr(self.backend, kind)
+                for op in ops:
+                    resolve(single(*op[3], **op[4]))
+        except Exception as e:
+            log.exception('Write-behind %s of %d tokens failed', kind, len(ops))
+            return e
+        return None
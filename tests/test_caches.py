@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+from flask_forward import OAuthService
+from flask_forward.stores import MemoryClientService, MemoryTokenService
+
+
+class CountingTokens(MemoryTokenService):
+
+    calls = 0
+
+    def validate(self, token, scopes, request):
+        self.calls += 1
+        return super().validate(token, scopes, request)
+
+
+def _validator(**kwargs):
+    validator = OAuthService(
+        None, MemoryClientService, CountingTokens, **kwargs).validator
+    validator.scope_registry.compile(['read'])
+    validator.scope_registry.compile(['write'])
+    return validator
+
+
+def _save(validator, token, scopes):
+    validator.save_bearer_token(
+        {'access_token': token, 'scope': scopes, 'expires_in': 100},
+        SimpleNamespace(client_id='c', user='u', scopes=scopes.split())
+    )
+
+
+def _valid(validator, token, scopes):
+    return validator.validate_bearer_token(token, scopes, SimpleNamespace())
+
+
+def test_token_cache_skips_backend():
+    validator = _validator(token_cache_ttl=60)
+    _save(validator, 't', 'read')
+    assert _valid(validator, 't', ['read'])
+    assert _valid(validator, 't', ['read'])
+    assert validator.token.calls == 1
+
+
+def test_token_cache_invalidated_on_revoke():
+    validator = _validator(token_cache_ttl=60)
+    _save(validator, 't', 'read')
+    assert _valid(validator, 't', ['read'])
+    validator.revoke_token('t', 'access_token', SimpleNamespace())
+    assert not _valid(validator, 't', ['read'])
+
+
+def test_token_cache_invalidated_on_save():
+    validator = _validator(token_cache_ttl=60)
+    _save(validator, 't', 'read write')
+    assert _valid(validator, 't', ['write'])
+    _save(validator, 't', 'read')
+    assert not _valid(validator, 't', ['write'])
+    assert _valid(validator, 't', ['read'])
+
+
+def test_negative_cache_skips_backend():
+    validator = _validator(negative_cache={'ttl': 60})
+    assert not _valid(validator, 't', ['read'])
+    assert not _valid(validator, 't', ['read'])
+    assert validator.token.calls == 1
+
+
+def test_negative_cache_discarded_on_save():
+    validator = _validator(negative_cache={'ttl': 60})
+    assert not _valid(validator, 't', ['read'])
+    _save(validator, 't', 'read')
+    assert _valid(validator, 't', ['read'])
@@ -0,0 +1,17 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+import import_budget
+
+
+def test_import_loads_no_optional_modules():
+    _, loaded = import_budget.check(runs=1)
+    assert loaded == []
+
+
+def test_import_within_budget():
+    own_ms, _ = import_budget.check(runs=3)
+    assert own_ms <= import_budget.BUDGET_MS
@@ -0,0 +1,49 @@
+from flask_forward.redirects import RedirectIndex
+
+
+def _index(*uris):
+    index = RedirectIndex()
+    index.update('c', uris)
+    return index
+
+
+def test_exact_match():
+    index = _index('https://app.example/cb')
+    assert index.match('c', 'https://app.example/cb')
+    assert index.match('c', 'HTTPS://APP.EXAMPLE/cb')
+    assert not index.match('c', 'https://app.example/cb/more')
+    assert not index.match('c', 'https://other.example/cb')
+    assert not index.match('other', 'https://app.example/cb')
+
+
+def test_prefix_match():
+    index = _index('https://app.example/cb/*')
+    assert index.match('c', 'https://app.example/cb/done')
+    assert index.match('c', 'https://app.example/cb/a/b?x=1')
+    assert not index.match('c', 'https://app.example/cbx')
+    assert not index.match('c', 'https://app.example/other')
+
+
+def test_dot_segments_never_match():
+    index = _index('https://app.example/cb/*', 'https://app.example/cb/../x')
+    for uri in ('https://app.example/cb/../admin',
+                'https://app.example/cb/./done',
+                'https://app.example/cb/%2e%2e/admin',
+                'https://app.example/cb/%2E%2E%5Cadmin',
+                'https://app.example/cb/../x'):
+        assert not index.match('c', uri), uri
+
+
+def test_fragments_never_match():
+    assert not _index('https://app.example/cb').match(
+        'c', 'https://app.example/cb#frag')
+
+
+def test_update_and_remove():
+    index = _index('https://app.example/a', 'https://app.example/b/*')
+    index.update('c', ['https://app.example/a'])
+    assert index.match('c', 'https://app.example/a')
+    assert not index.match('c', 'https://app.example/b/x')
+    index.remove('c')
+    assert 'c' not in index
+    assert not index.match('c', 'https://app.example/a')
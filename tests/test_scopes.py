@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+
+from flask import Flask
+
+from flask_forward import FlaskForward
+from flask_forward.scopes import ANY, ScopeRegistry
+from flask_forward.stores import MemoryClientService, MemoryTokenService
+
+
+def _client(**routes):
+    app = Flask(__name__)
+    api = FlaskForward(app, None, MemoryTokenService, MemoryClientService).auth_api
+    token = api.auth_service.validator.token
+    for name, scopes in (('rw', 'read write'), ('r', 'read'), ('x', 'admin')):
+        token.save(
+            {'access_token': name, 'scope': scopes, 'expires_in': 100},
+            SimpleNamespace(client_id='c', user='u', scopes=scopes.split())
+        )
+
+    for rule, kwargs in routes.items():
+        app.add_url_rule('/' + rule, rule, api.auth_required(
+            lambda: 'ok', token_auth=True, reject=True, **kwargs))
+    return app.test_client()
+
+
+def _status(client, rule, token):
+    return client.get(
+        '/' + rule, headers={'Authorization': 'Bearer ' + token}).status_code
+
+
+def test_all_of_needs_every_scope():
+    client = _client(both={'scope': ['read', 'write']})
+    assert _status(client, 'both', 'rw') == 200
+    assert _status(client, 'both', 'r') == 403
+    assert _status(client, 'both', 'unknown') == 401
+
+
+def test_any_of_needs_one_scope():
+    client = _client(either={'scope': ['read', 'write'], 'scope_match': ANY})
+    assert _status(client, 'either', 'rw') == 200
+    assert _status(client, 'either', 'r') == 200
+    assert _status(client, 'either', 'x') == 403
+
+
+def test_lookup_does_not_intern_unknown_scopes():
+    registry = ScopeRegistry()
+    registry.compile(['read'])
+    assert registry.lookup(['read']).mask
+    assert registry.lookup(['write']) is None
+    assert 'write' not in registry
@@ -0,0 +1,52 @@
+import os
+from types import SimpleNamespace
+
+from flask_forward.scopes import ScopeRegistry
+from flask_forward.sharedcache import SharedTokenCache
+
+
+def _cache(tmp_path):
+    registry = ScopeRegistry()
+    required = registry.compile(['read'])
+    cache = SharedTokenCache(str(tmp_path / 'cache'), slots=64,
+                             scope_registry=registry)
+    return cache, required
+
+
+def test_revocation_is_seen_across_fork(tmp_path):
+    cache, required = _cache(tmp_path)
+    cache.set('t', required, SimpleNamespace(scopes=['read']))
+    assert cache.get('t', required)
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            cache.invalidate('t')
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+
+    assert not cache.get('t', required)
+    cache.set('t', required, SimpleNamespace(scopes=['read']))
+    assert not cache.get('t', required)
+
+
+def test_child_entries_are_seen_by_parent(tmp_path):
+    cache, required = _cache(tmp_path)
+    pid = os.fork()
+    if pid == 0:
+        try:
+            cache.set('t', required, SimpleNamespace(scopes=['read']))
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    assert cache.get('t', required)
+
+
+def test_discard_does_not_tombstone(tmp_path):
+    cache, required = _cache(tmp_path)
+    cache.set('t', required, SimpleNamespace(scopes=['read']))
+    cache.discard('t')
+    assert not cache.get('t', required)
+    cache.set('t', required, SimpleNamespace(scopes=['read']))
+    assert cache.get('t', required)
@@ -0,0 +1,68 @@
+import os
+from types import SimpleNamespace
+
+from flask_forward.stores import MemoryTokenService, TimingWheel
+
+
+def _save(service, token):
+    service.save({'access_token': token, 'expires_in': 100},
+                 SimpleNamespace(client_id='c', user='u', scopes=[]))
+
+
+def test_timing_wheel_expires_on_deadline():
+    wheel = TimingWheel(resolution=1.0, slots=4, levels=2, clock=lambda: 0)
+    wheel.add('soon', 2)
+    wheel.add('later', 11)
+    wheel.add('overflow', 100)
+    assert wheel.advance(1) == []
+    assert wheel.advance(2) == ['soon']
+    assert wheel.advance(10) == []
+    assert wheel.advance(11) == ['later']
+    assert wheel.advance(99) == []
+    assert wheel.advance(100) == ['overflow']
+
+
+def test_timing_wheel_expires_past_deadlines_on_next_tick():
+    wheel = TimingWheel(resolution=1.0, clock=lambda: 10)
+    wheel.add('past', 5)
+    assert wheel.advance(11) == ['past']
+
+
+def test_journal_recovers_from_torn_tail(tmp_path):
+    path = str(tmp_path / 'tokens')
+    service = MemoryTokenService(journal=path)
+    _save(service, 'a')
+    _save(service, 'b')
+    service.close()
+
+    log = service.journal._log_path(0)
+    with open(log, 'rb+') as f:
+        f.truncate(os.path.getsize(log) - 3)
+
+    service = MemoryTokenService(journal=path)
+    assert service.validate('a', [], SimpleNamespace())
+    assert not service.validate('b', [], SimpleNamespace())
+    _save(service, 'c')
+    service.close()
+
+    service = MemoryTokenService(journal=path)
+    assert service.validate('a', [], SimpleNamespace())
+    assert service.validate('c', [], SimpleNamespace())
+    service.close()
+
+
+def test_journal_worker_template_gives_each_user_its_own(tmp_path):
+    path = str(tmp_path / 'tokens.{worker}')
+    first = MemoryTokenService(journal=path)
+    second = MemoryTokenService(journal=path)
+    _save(first, 'a')
+    _save(second, 'b')
+    assert first.journal.path.endswith('tokens.0')
+    assert second.journal.path.endswith('tokens.1')
+    second.close()
+
+    second = MemoryTokenService(journal=path)
+    assert second.validate('b', [], SimpleNamespace())
+    assert not second.validate('a', [], SimpleNamespace())
+    first.close()
+    second.close()
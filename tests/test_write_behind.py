@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+import pytest
+
+from flask_forward.scopes import ScopeRegistry
+from flask_forward.writebehind import WriteBehindQueue
+
+
+class RecordingStore(object):
+
+    def __init__(self, failures=0):
+        self.ops = []
+        self.failures = failures
+
+    def _fail(self):
+        if self.failures:
+            self.failures -= 1
+            raise IOError('store unavailable')
+
+    def save_many(self, items):
+        self._fail()
+        self.ops.extend(('save', token['access_token']) for token, _ in items)
+
+    def revoke_many(self, items):
+        self._fail()
+        self.ops.extend(('revoke', item[0]) for item in items)
+
+
+def _queue(store, **kwargs):
+    registry = ScopeRegistry()
+    registry.compile(['read'])
+    kwargs.setdefault('flush_interval', 60)
+    return WriteBehindQueue(store, scope_registry=registry, **kwargs), registry
+
+
+def _save(queue, token):
+    queue.save(
+        {'access_token': token, 'scope': 'read', 'expires_in': 100},
+        SimpleNamespace(client_id='c', user='u')
+    )
+
+
+def test_unwritten_save_and_revoke_are_visible():
+    store = RecordingStore()
+    queue, registry = _queue(store)
+    required = registry.lookup(['read'])
+    _save(queue, 't')
+    assert store.ops == []
+    assert queue.lookup('t', required) is True
+    queue.revoke('t', 'access_token', None)
+    assert queue.lookup('t', required) is False
+    queue.close()
+    assert queue.lookup('t', required) is None
+
+
+def test_store_sees_operations_in_order():
+    store = RecordingStore()
+    queue, _ = _queue(store, batch_size=3, maxsize=4, put_timeout=0)
+    expected = []
+    for i in range(20):
+        _save(queue, str(i))
+        queue.revoke(str(i), 'access_token', None)
+        expected += [('save', str(i)), ('revoke', str(i))]
+    queue.close()
+    assert store.ops == expected
+
+
+def test_failed_writes_stay_queued():
+    store = RecordingStore(failures=1)
+    queue, registry = _queue(store)
+    queue.revoke('t', 'access_token', None)
+    with pytest.raises(IOError):
+        queue.flush()
+    assert queue.lookup('t', registry.lookup(['read'])) is False
+    queue.flush()
+    assert store.ops == [('revoke', 't')]
+    queue.close()